@@ -1,13 +1,35 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import os
 from supabase import create_client, Client
+from supabase.lib.client_options import SyncClientOptions
 from dotenv import load_dotenv
 import io
+import csv
 import json
+import math
+import re
+import time
+import itertools
+import hashlib
+import uuid
+import threading
+import queue
+import atexit
+import tempfile
+import httpx
 import plotly.express as px
 import plotly.graph_objects as go
+from openpyxl import Workbook, load_workbook
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet export is offered only when pyarrow is installed
+    pa = pq = None
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FutureTimeoutError
+from collections import OrderedDict
 
 # Page configuration
 st.set_page_config(page_title="Metadata-Driven Platform", layout="wide")
@@ -18,22 +40,361 @@ load_dotenv()
 # Supabase configuration
 SUPABASE_URL =  st.secrets["SUPABASE_URL"] #os.getenv("VITE_SUPABASE_URL")
 SUPABASE_KEY = st.secrets["SUPABASE_KEY"] #os.getenv("SUPABASE_SERVICE_ROLE_KEY")
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+# HTTP connection pool shared by every session in this process
+SUPABASE_POOL_SIZE = int(st.secrets.get("SUPABASE_POOL_SIZE", 20))
+SUPABASE_TIMEOUT = float(st.secrets.get("SUPABASE_TIMEOUT", 60))
+SUPABASE_CONNECT_TIMEOUT = float(st.secrets.get("SUPABASE_CONNECT_TIMEOUT", 5))
+
+# Create the client once per process and reuse its keep-alive connections across reruns and sessions
+@st.cache_resource
+def get_supabase_client():
+    http_client = httpx.Client(
+        limits=httpx.Limits(max_connections=SUPABASE_POOL_SIZE, max_keepalive_connections=SUPABASE_POOL_SIZE),
+        timeout=httpx.Timeout(SUPABASE_TIMEOUT, connect=SUPABASE_CONNECT_TIMEOUT),
+        follow_redirects=True
+    )
+    return create_client(SUPABASE_URL, SUPABASE_KEY, options=SyncClientOptions(httpx_client=http_client))
+
+supabase: Client = get_supabase_client()
+
+# Bulk insert configuration
+INSERT_BATCH_SIZE = 5000
+INSERT_MAX_WORKERS = 4
+INSERT_MAX_RETRIES = 3
+INSERT_RETRY_BACKOFF = 0.5  # Seconds, doubled on every retry
+# SQLSTATE classes worth retrying: connection, transaction rollback, resources and operator intervention
+# (the database reports these after rolling the insert back, so nothing was written)
+TRANSIENT_SQLSTATE_CLASSES = ("08", "40", "53", "57")
+
+# Streaming upload configuration
+UPLOAD_CHUNK_SIZE = 50000
+BULK_LOAD_MAX_MB = int(st.secrets.get("BULK_LOAD_MAX_MB", 50))  # Largest single-call bulk load script; larger files use batched inserts
+
+# Schema cache configuration
+SCHEMA_CACHE_TTL = int(st.secrets.get("SCHEMA_CACHE_TTL", 300))
+
+# In-memory cache with per-entry expiry, an optional size cap with LRU eviction and hit/miss counters,
+# safe to share between sessions
+class TTLCache:
+    def __init__(self, ttl_seconds, max_bytes=None, sizeof=None, raw_sizeof=None):
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.raw_sizeof = raw_sizeof  # Optional size of an entry before compaction, reported next to its real size
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.total_raw_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def _lookup(self, key, now):
+        entry = self.entries.get(key)
+        if entry and entry[0] > now:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return True, entry[1]
+        self.misses += 1
+        return False, None
+
+    def _store(self, key, value):
+        self._remove(key)
+        size = self.sizeof(value) if self.sizeof else 0
+        raw_size = self.raw_sizeof(value) if self.raw_sizeof else size
+        self.entries[key] = (time.monotonic() + self.ttl_seconds, value, size, raw_size)
+        self.total_bytes += size
+        self.total_raw_bytes += raw_size
+        # Evict the least recently used entries until the cache fits its size cap again
+        while self.max_bytes and self.total_bytes > self.max_bytes and len(self.entries) > 1:
+            self._remove(next(iter(self.entries)))
+            self.evictions += 1
+
+    def _remove(self, key):
+        entry = self.entries.pop(key, None)
+        if entry:
+            self.total_bytes -= entry[2]
+            self.total_raw_bytes -= entry[3]
+
+    def get(self, key, loader):
+        with self.lock:
+            found, value = self._lookup(key, time.monotonic())
+        if found:
+            return value
+        value = loader()
+        with self.lock:
+            self._store(key, value)
+        return value
+
+    def get_many(self, keys, loader):
+        # The loader receives the missing keys and returns a dict with their values
+        found = {}
+        missing = []
+        with self.lock:
+            now = time.monotonic()
+            for key in keys:
+                hit, value = self._lookup(key, now)
+                if hit:
+                    found[key] = value
+                else:
+                    missing.append(key)
+        if missing:
+            loaded = loader(missing)
+            with self.lock:
+                for key in missing:
+                    found[key] = loaded.get(key, [])
+                    self._store(key, found[key])
+        return found
+
+    def put(self, key, value):
+        with self.lock:
+            self._store(key, value)
+
+    def invalidate(self, key=None):
+        with self.lock:
+            if key is None:
+                self.entries.clear()
+                self.total_bytes = 0
+                self.total_raw_bytes = 0
+            else:
+                self._remove(key)
+
+    def invalidate_matching(self, predicate):
+        with self.lock:
+            for key in [key for key in self.entries if predicate(key)]:
+                self._remove(key)
+
+    def stats(self):
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self.entries),
+                    "bytes": self.total_bytes, "raw_bytes": self.total_raw_bytes, "evictions": self.evictions}
+
+# Schema cache shared by every session in this process
+@st.cache_resource
+def get_schema_cache():
+    return TTLCache(SCHEMA_CACHE_TTL)
+
+# Function to drop cached schema entries after DDL on a table
+def invalidate_schema_cache(table_name):
+    schema_cache = get_schema_cache()
+    schema_cache.invalidate(("tables",))
+    schema_cache.invalidate(("columns", table_name))
+
+# Result cache configuration
+RESULT_CACHE_TTL = int(st.secrets.get("RESULT_CACHE_TTL", 600))
+RESULT_CACHE_MAX_MB = int(st.secrets.get("RESULT_CACHE_MAX_MB", 256))
+
+# Function to measure the memory held by a cached value (DataFrames only)
+def dataframe_bytes(value):
+    return int(value.memory_usage(deep=True).sum()) if isinstance(value, pd.DataFrame) else 0
+
+# Indicator result cache shared by every session in this process, sized by DataFrame memory
+@st.cache_resource
+def get_result_cache():
+    return TTLCache(
+        RESULT_CACHE_TTL,
+        max_bytes=RESULT_CACHE_MAX_MB * 1024 * 1024,
+        sizeof=dataframe_bytes,
+        raw_sizeof=lambda value: value.attrs.get("raw_bytes", dataframe_bytes(value)) if isinstance(value, pd.DataFrame) else 0
+    )
+
+# Function to build the result cache key of a query
+def query_cache_key(query, params=None):
+    key_text = query + ("\n" + json.dumps(params) if params else "")
+    return ("result", hashlib.sha256(key_text.encode("utf-8")).hexdigest())
+
+# Type inference configuration (raw tables are all TEXT, so result columns arrive as strings)
+TYPE_INFERENCE_SAMPLE_ROWS = 1000
+CATEGORY_MAX_UNIQUE_RATIO = 0.5  # Text columns with at most this share of distinct values become categories
+# Numbers whose text survives conversion; signs, zero padding, exponents and separators keep a column as text
+NUMERIC_TEXT_PATTERN = re.compile(r"^-?(0|[1-9]\d*)(\.\d+)?$")
+
+# Function to infer the type of each result column from a sample of its non-null values
+def infer_column_types(df, sample_rows=TYPE_INFERENCE_SAMPLE_ROWS):
+    schema = {}
+    sample_df = df.head(sample_rows)
+    for column in df.columns:
+        sample = sample_df[column].dropna()
+        if sample.empty:
+            schema[column] = "text"
+        elif pd.to_numeric(sample, errors="coerce").notna().all() and numeric_text_preserved(sample):
+            schema[column] = "numeric"
+        elif pd.to_datetime(sample.astype(str), errors="coerce", format="ISO8601", utc=True).notna().all():
+            schema[column] = "datetime"
+        elif sample.astype(str).nunique() <= len(sample) * CATEGORY_MAX_UNIQUE_RATIO and sample.map(lambda v: isinstance(v, str)).all():
+            schema[column] = "category"
+        else:
+            schema[column] = "text"
+    return schema
+
+# Function to check that every text value of a column reads back the same after conversion to a number
+def numeric_text_preserved(series):
+    def preserved(value):
+        if not isinstance(value, str):
+            return True
+        if not NUMERIC_TEXT_PATTERN.match(value):
+            return False
+        # The float must print back as the same text: long IDs lose digits and '1.10' would show as 1.1
+        number = float(value)
+        return (str(int(number)) if "." not in value else repr(number)) == value
+    return series.dropna().map(preserved).all()
+
+# Function to convert one column to its inferred type, returning None when the conversion would lose or alter values
+def convert_column(series, column_type):
+    if column_type == "numeric":
+        if not numeric_text_preserved(series):
+            return None
+        converted = pd.to_numeric(series, errors="coerce")
+    elif column_type == "datetime":
+        try:
+            converted = pd.to_datetime(series, errors="coerce", format="ISO8601")
+        except ValueError:
+            converted = pd.to_datetime(series, errors="coerce", format="ISO8601", utc=True)
+    elif column_type == "category":
+        return series.astype("category")
+    else:
+        return series
+    # Values the sample did not cover may not fit the type; coercing them to NaN/NaT would silently drop them
+    return converted if converted.notna().sum() == series.notna().sum() else None
+
+# Function to convert whole result columns to their inferred types; columns that do not fit stay text
+def apply_column_types(df, schema):
+    applied = dict(schema)
+    for column, column_type in schema.items():
+        if column not in df.columns:
+            continue
+        converted = convert_column(df[column], column_type)
+        if converted is None:
+            applied[column] = "text"
+        else:
+            df[column] = converted
+    return df, applied
+
+# Function to shrink a typed result in place: low-cardinality text to categories, integers and exactly
+# representable floats to smaller widths, other text to Arrow-backed strings
+def compact_dataframe(df):
+    for col in df.columns:
+        series = df[col]
+        if isinstance(series.dtype, pd.CategoricalDtype) or pd.api.types.is_bool_dtype(series):
+            continue
+        if pd.api.types.is_integer_dtype(series):
+            df[col] = pd.to_numeric(series, downcast="integer")
+        elif pd.api.types.is_float_dtype(series):
+            narrowed = series.astype("float32")
+            if (narrowed.astype("float64").eq(series) | series.isna()).all():
+                df[col] = narrowed
+        elif series.dtype == object or pd.api.types.is_string_dtype(series):
+            try:
+                unique_values = series.nunique()
+            except TypeError:  # JSON columns hold dicts and lists, which stay as they are
+                continue
+            if unique_values <= len(series) * CATEGORY_MAX_UNIQUE_RATIO:
+                df[col] = series.astype("category")
+            elif pa is not None:
+                df[col] = series.astype(pd.StringDtype("pyarrow"))
+    return df
+
+# Function to build a typed result DataFrame, reusing the schema cached for the query
+def result_dataframe(query, rows):
+    df = pd.DataFrame(rows or [])
+    if df.empty:
+        return df
+    schema_cache = get_schema_cache()
+    types_key = ("types", query_cache_key(query)[1])
+    schema = schema_cache.get(types_key, lambda: infer_column_types(df))
+    if set(schema) != set(df.columns):
+        schema = infer_column_types(df)
+        schema_cache.put(types_key, schema)
+    raw_bytes = dataframe_bytes(df)
+    df, applied = apply_column_types(df, schema)
+    if applied != schema:
+        # A column failed its cached type, so store the corrected schema instead of reusing the stale one
+        schema_cache.put(types_key, applied)
+    df = compact_dataframe(df)
+    df.attrs["raw_bytes"] = raw_bytes
+    return df
+
+# Function to load an indicator result, running the query only on a cache miss
+def get_indicator_result(query, params=None):
+    return get_result_cache().get(
+        query_cache_key(query, params),
+        lambda: result_dataframe(query, fetch_query_data(query, params, timeout_seconds=None))
+    )
+
+# Function to drop every cached result derived from a query (full result, row count, pages and inferred types)
+def invalidate_query_results(query, params=None):
+    query_hash = query_cache_key(query, params)[1]
+    get_result_cache().invalidate_matching(lambda key: key[1] == query_hash)
+    get_schema_cache().invalidate(("types", query_cache_key(query)[1]))
+
+# Pagination configuration
+PREVIEW_ROW_LIMIT = 100
+PAGE_SIZE = 500
+COUNT_ESTIMATE_CAP = 100000  # Row counts stop here so counting never scans a whole large result
+
+# Aggregations pushed down to the database for Bar and Pie charts
+CHART_AGGREGATIONS = ["SUM", "AVG", "COUNT"]
+LINE_CHART_POINT_BUDGET = int(st.secrets.get("LINE_CHART_POINT_BUDGET", 2000))  # Points kept per line before downsampling
+
+# Function to list the aggregations a chart value column supports (SUM and AVG cast it to numeric, so only numeric columns get them)
+def chart_aggregations(series):
+    if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+        return CHART_AGGREGATIONS
+    return ["COUNT"]
 
 # Supabase interaction functions
 def get_all_tables():
-    response = supabase.rpc("get_all_tables").execute()
-    if hasattr(response, 'data') and response.data:
-        # Only filter tables from the 'public' schema
-        tables = [row['table_name'] for row in response.data if row['table_schema'] == 'public']
-        return tables
-    return []
+    def load_tables():
+        response = supabase.rpc("get_all_tables").execute()
+        if hasattr(response, 'data') and response.data:
+            # Only filter tables from the 'public' schema
+            tables = [row['table_name'] for row in response.data if row['table_schema'] == 'public']
+            return tables
+        return []
+    return get_schema_cache().get(("tables",), load_tables)
 
 def get_table_columns(table_name):
-    response = supabase.rpc("get_table_columns", {"p_table_name": table_name}).execute()
-    if hasattr(response, 'data') and response.data:
-        return response.data
-    return []
+    return get_tables_metadata([table_name])[table_name]
+
+# Column metadata for several tables in one round trip; "indexes" lists the indexes led by each column
+SCHEMA_METADATA_QUERY = """
+SELECT c.table_name, c.column_name, c.data_type, c.is_nullable,
+       COALESCE((
+           SELECT json_agg(i.relname ORDER BY i.relname)
+           FROM pg_index x
+           JOIN pg_class t ON t.oid = x.indrelid
+           JOIN pg_namespace n ON n.oid = t.relnamespace
+           JOIN pg_class i ON i.oid = x.indexrelid
+           JOIN pg_attribute a ON a.attrelid = t.oid AND a.attnum = x.indkey[0]
+           WHERE n.nspname = c.table_schema AND t.relname = c.table_name AND a.attname = c.column_name
+       ), '[]') AS indexes
+FROM information_schema.columns c
+WHERE c.table_schema = 'public'{table_filter}
+ORDER BY c.table_name, c.ordinal_position
+"""
+
+# Function to get columns, data types and indexes for a list of tables (or the whole public schema)
+def get_tables_metadata(table_names=None):
+    def load_metadata(keys):
+        table_filter = ""
+        if keys is not None:
+            table_filter = " AND c.table_name IN (" + ", ".join(sql_literal(key[1]) for key in keys) + ")"
+        metadata = {key: [] for key in keys or []}
+        for row in execute_sql(SCHEMA_METADATA_QUERY.format(table_filter=table_filter)) or []:
+            if isinstance(row.get("indexes"), str):
+                row["indexes"] = json.loads(row["indexes"])
+            metadata.setdefault(("columns", row.pop("table_name")), []).append(row)
+        return metadata
+
+    schema_cache = get_schema_cache()
+    if table_names is None:
+        # Whole schema: load everything in one request and warm the cache for each table
+        metadata = load_metadata(None)
+        for key, columns in metadata.items():
+            schema_cache.put(key, columns)
+        return {key[1]: columns for key, columns in metadata.items()}
+    metadata = schema_cache.get_many([("columns", table) for table in table_names], load_metadata)
+    return {key[1]: columns for key, columns in metadata.items()}
 
 def execute_sql(query):
     response = supabase.rpc("execute_sql", {"query": query}).execute()
@@ -43,6 +404,90 @@ def execute_sql_2(query):
     response = supabase.rpc("execute_sql_2", {"query": query}).execute()
     return response.data
 
+# Lineage writer configuration
+LINEAGE_FLUSH_INTERVAL = float(st.secrets.get("LINEAGE_FLUSH_INTERVAL", 2.0))  # Seconds an event may wait before its batch is written
+LINEAGE_BATCH_SIZE = 100
+LINEAGE_CLOSE_TIMEOUT = float(st.secrets.get("LINEAGE_CLOSE_TIMEOUT", 30.0))  # Seconds close waits for the writer thread's final drain
+LINEAGE_MAX_FLUSH_ATTEMPTS = 3  # Flushes a failed event is retried in before it is dropped
+
+# Background writer that buffers lineage events and inserts them in batches, off the request path
+class LineageWriter:
+    def __init__(self, flush_interval=LINEAGE_FLUSH_INTERVAL, batch_size=LINEAGE_BATCH_SIZE):
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.events = queue.Queue()
+        self.written = 0
+        self.failed = 0
+        self.last_error = None
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="lineage-writer", daemon=True)
+        self.thread.start()
+
+    def _next_batch(self):
+        # Wait for a first event, then keep collecting until the batch is full or the interval has passed
+        try:
+            batch = [self.events.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self.events.get(timeout=max(0, deadline - time.monotonic())))
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch):
+        status = insert_batch_with_retry("data_lineage", [event for _, event in batch])
+        if status["status"] == "ok":
+            self.written += len(batch)
+        else:
+            self.last_error = status["error"]
+            for attempts, event in batch:
+                if attempts + 1 < LINEAGE_MAX_FLUSH_ATTEMPTS:
+                    self.events.put((attempts + 1, event))
+                else:
+                    self.failed += 1
+        for _ in batch:
+            self.events.task_done()
+
+    def _run(self):
+        while not self.stopped.is_set():
+            batch = self._next_batch()
+            if batch:
+                self._write(batch)
+        # Final drain after close: only this thread writes, and every remaining event gets one last attempt
+        while True:
+            batch = []
+            while len(batch) < self.batch_size and not self.events.empty():
+                batch.append(self.events.get_nowait())
+            if not batch:
+                return
+            self._write([(LINEAGE_MAX_FLUSH_ATTEMPTS, event) for _, event in batch])
+
+    def write(self, event):
+        self.events.put((0, event))
+
+    def flush(self):
+        # Block until every queued event has been written or given up on
+        self.events.join()
+
+    def close(self, timeout=LINEAGE_CLOSE_TIMEOUT):
+        # Signal the thread and wait for it to finish its current batch and the final drain
+        self.stopped.set()
+        self.thread.join(timeout=timeout)
+
+    def stats(self):
+        return {"pending": self.events.qsize(), "written": self.written, "failed": self.failed,
+                "last_error": self.last_error}
+
+# Lineage writer shared by every session in this process, flushed when the process exits
+@st.cache_resource
+def get_lineage_writer():
+    writer = LineageWriter()
+    atexit.register(writer.close)
+    return writer
+
 def log_data_lineage(source_table, target_table, rows, layer, transformation_query):
     data = {
         "source_table": source_table,
@@ -51,38 +496,123 @@ def log_data_lineage(source_table, target_table, rows, layer, transformation_que
         "layer": layer,
         "transformation_query": transformation_query
     }
-    response = supabase.table("data_lineage").insert(data).execute()
-    return response.data
+    get_lineage_writer().write(data)
+    return data
 
-def save_metadata_mapping(source_table, source_column, target_table, target_column, 
-                          transformation_rule, data_type, is_nullable):
-    data = {
-        "source_table": source_table,
-        "source_column": source_column,
-        "target_table": target_table,
-        "target_column": target_column,
-        "transformation_rule": transformation_rule,
-        "data_type": data_type,
-        "is_nullable": is_nullable
-    }
-    response = supabase.table("metadata_mappings").insert(data).execute()
-    return response.data
+# Function to render a Python value as a SQL literal for the metadata tables
+def sql_value(value):
+    if isinstance(value, bool):
+        return "TRUE" if value else "FALSE"
+    if isinstance(value, (int, float)):
+        return str(value)
+    if isinstance(value, (list, dict)):
+        return sql_literal(json.dumps(value)) + "::jsonb"
+    return sql_literal(value)
 
-def get_metadata_mappings():
-    response = supabase.table("metadata_mappings").select("*").execute()
-    if hasattr(response, 'data') and response.data:
-        return response.data
-    return []
+# Function to write many metadata mappings, and optionally their lineage row, as one script run in a single transaction
+def save_metadata_mappings(mappings, lineage=None, catalog=None):
+    statements = []
+    if catalog:
+        columns = list(catalog)
+        updates = ", ".join(f"{column} = EXCLUDED.{column}" for column in columns if column != "target_table")
+        statements.append(
+            f"INSERT INTO meta_indicator_catalog ({', '.join(columns)}) VALUES "
+            f"({', '.join(sql_value(catalog[column]) for column in columns)})\n"
+            f"ON CONFLICT (target_table) DO UPDATE SET {updates}, updated_at = current_timestamp;"
+        )
+    for table_name, rows in (("metadata_mappings", mappings), ("data_lineage", [lineage] if lineage else [])):
+        if not rows:
+            continue
+        columns = list(dict.fromkeys(column for row in rows for column in row))
+        values = ",\n".join("(" + ", ".join(sql_value(row.get(column)) for column in columns) + ")" for row in rows)
+        statements.append(f"INSERT INTO {table_name} ({', '.join(columns)}) VALUES\n{values};")
+    if statements:
+        execute_sql_2("\n".join(statements))
+    if catalog:
+        invalidate_indicator_catalog(catalog["target_table"])
 
-# Function to create a new raw table
-def create_raw_table(table_name, df):
-    # Rename columns according to rules
+# The indicator catalog (meta_indicator_catalog, one row per indicator with its SQL, so dashboards never scan
+# metadata_mappings) ships as supabase/migrations/20261016120200_indicator_catalog.sql
+
+# Function to list indicator names from the catalog
+def get_indicator_names():
+    def load_names():
+        rows = execute_sql("SELECT target_table FROM meta_indicator_catalog ORDER BY target_table") or []
+        return [row["target_table"] for row in rows]
+    return get_schema_cache().get(("indicators",), load_names)
+
+# Function to fetch one indicator's definition by primary key
+def get_indicator_definition(target_table):
+    def load_definition():
+        rows = execute_sql(
+            "SELECT target_table, source_tables, transformation_rule, compiled_query, query_params "
+            f"FROM meta_indicator_catalog WHERE target_table = {sql_literal(target_table)}"
+        ) or []
+        return rows[0] if rows else {}
+    return get_schema_cache().get(("indicator", target_table), load_definition)
+
+# Function to drop the cached catalog entries after an indicator is saved
+def invalidate_indicator_catalog(target_table):
+    schema_cache = get_schema_cache()
+    schema_cache.invalidate(("indicators",))
+    schema_cache.invalidate(("indicator", target_table))
+
+# Function to apply the column naming rules to an uploaded DataFrame
+def normalize_columns(df):
     df.columns = [col.lower().replace(' ', '_').replace('-', '_').replace('.', '_').replace('/', '_') for col in df.columns]
+    return df
+
+# Function to render a Python value as a SQL string literal
+def sql_literal(value):
+    if value is None:
+        return "NULL"
+    return "'" + str(value).replace("'", "''") + "'"
+
+# Function to render every row of a DataFrame as a SQL VALUES tuple, one vectorized pass per column
+def dataframe_to_sql_values(df):
+    literals = [
+        ("'" + df[col].astype(str).str.replace("'", "''", regex=False) + "'").where(df[col].notna(), "NULL")
+        for col in df.columns
+    ]
+    rows = literals[0]
+    for literal in literals[1:]:
+        rows = rows + ", " + literal
+    return "(" + rows + ")"
+
+# Column types the create flow can propose for uploaded data
+COLUMN_TYPES = ["TEXT", "INTEGER", "NUMERIC", "DATE", "TIMESTAMPTZ", "BOOLEAN"]
+INTEGER_MAX = 2**31 - 1
+
+# Function to propose a column type for each uploaded column from its text values, one vectorized pass per column
+def profile_column_types(df):
+    column_types = {}
+    for col in df.columns:
+        values = df[col].dropna().astype(str).str.strip()
+        values = values[values != ""]
+        numbers = pd.to_numeric(values, errors="coerce")
+        if values.empty or values.str.match(r"^[+-]?0\d").any():  # Zero-padded codes stay TEXT so their leading zeros survive
+            column_types[col] = "TEXT"
+        elif values.str.lower().isin(["true", "false", "t", "f"]).all():
+            column_types[col] = "BOOLEAN"
+        elif values.str.fullmatch(r"[+-]?\d+").all() and numbers.abs().max() <= INTEGER_MAX:
+            column_types[col] = "INTEGER"
+        elif numbers.notna().all():
+            column_types[col] = "NUMERIC"
+        elif pd.to_datetime(values, errors="coerce", format="ISO8601", utc=True).notna().all():
+            column_types[col] = "DATE" if values.str.fullmatch(r"\d{4}-\d{2}-\d{2}").all() else "TIMESTAMPTZ"
+        else:
+            column_types[col] = "TEXT"
+    return column_types
+
+# Function to build the CREATE TABLE script for an uploaded DataFrame
+def build_create_table_query(table_name, df, column_types=None):
+    # Rename columns according to rules
+    normalize_columns(df)
 
     # Create SQL script for table creation
     columns = []
     for col in df.columns:
-        columns.append(f"{col.upper()} TEXT")
+        columns.append(f"{col.upper()} {(column_types or {}).get(col, 'TEXT')}")
     
     # Add control columns and ID
     columns.insert(0, "ID SERIAL PRIMARY KEY")
@@ -94,35 +624,827 @@ def create_raw_table(table_name, df):
     # Create SQL query
     create_table_query = f"CREATE TABLE {table_name} (\n\t" + ",\n\t".join(columns) + "\n);"
     
+    return create_table_query
+
+# Function to record the declared type of each raw table column in metadata_mappings, together with the lineage row
+def record_column_types(table_name, columns, column_types, create_table_query, rows):
+    save_metadata_mappings(
+        [
+            {
+                "source_table": "upload",
+                "source_column": col,
+                "target_table": table_name,
+                "target_column": col.lower(),
+                "transformation_rule": create_table_query,
+                "data_type": (column_types or {}).get(col, "TEXT"),
+                "is_nullable": True
+            }
+            for col in columns
+        ],
+        lineage={"source_table": "upload", "target_table": table_name, "rows": rows, "layer": "raw",
+                 "transformation_query": create_table_query}
+    )
+
+# Function to create a new raw table
+def create_raw_table(table_name, df, column_types=None):
+    create_table_query = build_create_table_query(table_name, df, column_types)
+
     # Execute query
     result = execute_sql_2(create_table_query)
+    invalidate_schema_cache(table_name)
     
     # Log in lineage table
-    log_data_lineage("upload", table_name, len(df), "raw", create_table_query)
+    record_column_types(table_name, df.columns, column_types, create_table_query, len(df))
     
     return result
 
-# Function to insert data into table
-def insert_data_to_table(table_name, df):
-    # Rename columns according to rules
-    df.columns = [col.lower().replace(' ', '_').replace('-', '_').replace('.', '_') for col in df.columns]
-
-    # Prepare data for insertion
-    records = []
-    for _, row in df.iterrows():
-        record = {}
-        for col in df.columns:
-            record[col] = str(row[col]) if pd.notna(row[col]) else None
-        records.append(record)
-    
-    # Insert data
-    response = supabase.table(table_name).insert(records).execute()
-    
+# Function to create a raw table and load every chunk with it in a single server-side call
+def create_raw_table_with_data(table_name, chunks, column_types=None):
+    started_at = time.perf_counter()
+    chunks = iter(chunks)
+    first_chunk = next(chunks)
+    create_table_query = build_create_table_query(table_name, first_chunk, column_types)
+    columns = ", ".join(col.upper() for col in first_chunk.columns)
+
+    # Stage every row as one compact multi-row VALUES payload
+    script = io.StringIO()
+    script.write(create_table_query + "\n")
+    rows = 0
+    for chunk in itertools.chain([first_chunk], chunks):
+        normalize_columns(chunk)
+        if chunk.empty:
+            continue
+        script.write(f"INSERT INTO {table_name} ({columns}) VALUES\n" if not rows else ",\n")
+        script.write(",\n".join(dataframe_to_sql_values(chunk)))
+        rows += len(chunk)
+        if script.tell() > BULK_LOAD_MAX_MB * 1024 * 1024:
+            # Stop before the script outgrows memory and the request size limit; nothing has been sent yet
+            raise ValueError(f"Bulk load is limited to {BULK_LOAD_MAX_MB} MB; use the batched insert for this file")
+    script.write(";" if rows else "")
+
+    # The RPC runs the whole script in one transaction, so a failure leaves no table behind
+    execute_sql_2(script.getvalue())
+    invalidate_schema_cache(table_name)
+    elapsed = time.perf_counter() - started_at
+
     # Log in lineage table
+    record_column_types(table_name, first_chunk.columns, column_types, create_table_query, rows)
+    summary = {
+        "rows_ok": rows,
+        "rows_failed": 0,
+        "elapsed_seconds": round(elapsed, 3),
+        "rows_per_second": round(rows / elapsed, 1) if elapsed else None,
+        "batches": [{"batch": 1, "rows": rows, "status": "ok", "attempts": 1, "seconds": round(elapsed, 3),
+                     "rows_per_second": round(rows / elapsed, 1) if elapsed else None}]
+    }
     insert_query = f"INSERT INTO {table_name} (...) VALUES (...)"  # Simplified for logging
-    log_data_lineage("upload", table_name, len(records), "raw", insert_query)
+    log_data_lineage("upload", table_name, rows, "raw", insert_query + "\n-- bulk load: " + json.dumps(summary))
+
+    summary["failed_records"] = []
+    return summary
+
+# Function to convert a DataFrame into insert records in one vectorized step
+def dataframe_to_records(df):
+    # Send every value as text and keep missing values as NULL
+    values = df.astype(str).astype(object).where(df.notna(), None)
+    return values.to_dict(orient="records")
+
+# Function to decide whether a failed request is worth retrying
+def is_transient_error(error):
+    # Inserts are not idempotent (raw tables only have a SERIAL key), so only failures that happened before the
+    # request reached the database are retried; a read timeout or a 5xx may come after the batch was committed
+    if isinstance(error, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)):
+        return True
+    code = str(getattr(error, "code", "") or "")
+    if code.isdigit() and len(code) == 3:
+        # HTTP status returned by the gateway without forwarding the request
+        return code in ("429", "503")
+    return code.startswith(TRANSIENT_SQLSTATE_CLASSES)
+
+# Function to insert one batch, retrying transient failures with exponential backoff
+def insert_batch_with_retry(table_name, batch, max_retries=INSERT_MAX_RETRIES):
+    started_at = time.perf_counter()
+    status = {"rows": len(batch), "status": "ok", "attempts": 0}
+    while True:
+        status["attempts"] += 1
+        try:
+            supabase.table(table_name).insert(batch).execute()
+            break
+        except Exception as e:
+            if status["attempts"] > max_retries or not is_transient_error(e):
+                status["status"] = "failed"
+                status["error"] = str(e)
+                break
+            time.sleep(INSERT_RETRY_BACKOFF * 2 ** (status["attempts"] - 1))
+
+    elapsed = time.perf_counter() - started_at
+    status["seconds"] = round(elapsed, 3)
+    status["rows_per_second"] = round(len(batch) / elapsed, 1) if elapsed else None
+    return status
+
+# Function to push insert batches through a bounded thread pool
+def upload_batches(table_name, records, batch_size=INSERT_BATCH_SIZE, max_workers=INSERT_MAX_WORKERS,
+                   progress_callback=None):
+    batches = [records[start:start + batch_size] for start in range(0, len(records), batch_size)]
+    batch_stats = []
+    failed_records = []
+    rows_done = 0
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(insert_batch_with_retry, table_name, batch): number
+            for number, batch in enumerate(batches, start=1)
+        }
+        for future in as_completed(futures):
+            status = {"batch": futures[future], **future.result()}
+            batch_stats.append(status)
+            if status["status"] == "failed":
+                failed_records.extend(batches[status["batch"] - 1])
+            rows_done += status["rows"]
+            if progress_callback:
+                progress_callback(rows_done, len(records))
+
+    return sorted(batch_stats, key=lambda status: status["batch"]), failed_records
+
+# Function to summarize an upload and log it in the lineage table
+def log_upload_summary(table_name, batch_stats, failed_records, elapsed):
+    rows_ok = sum(status["rows"] for status in batch_stats if status["status"] == "ok")
+    summary = {
+        "rows_ok": rows_ok,
+        "rows_failed": len(failed_records),
+        "elapsed_seconds": round(elapsed, 3),
+        "rows_per_second": round(rows_ok / elapsed, 1) if elapsed else None,
+        "batches": batch_stats
+    }
+
+    # Log in lineage table
+    insert_query = f"INSERT INTO {table_name} (...) VALUES (...)"  # Simplified for logging
+    log_data_lineage("upload", table_name, rows_ok, "raw", insert_query + "\n-- summary: " + json.dumps(summary))
     st.write(insert_query)
-    return response.data
+
+    # Keep the failed rows so only those batches have to be sent again
+    summary["failed_records"] = failed_records
+    return summary
+
+# Function to insert prepared records into a table
+def insert_records_to_table(table_name, records, batch_size=INSERT_BATCH_SIZE, max_workers=INSERT_MAX_WORKERS,
+                            progress_callback=None):
+    started_at = time.perf_counter()
+    batch_stats, failed_records = upload_batches(table_name, records, batch_size, max_workers, progress_callback)
+    return log_upload_summary(table_name, batch_stats, failed_records, time.perf_counter() - started_at)
+
+# Function to insert a stream of DataFrame chunks, keeping only one chunk in memory at a time
+def insert_chunks_to_table(table_name, chunks, batch_size=INSERT_BATCH_SIZE, max_workers=INSERT_MAX_WORKERS,
+                           progress_callback=None, total_rows=None):
+    started_at = time.perf_counter()
+    batch_stats = []
+    failed_records = []
+    rows_done = 0
+    for chunk in chunks:
+        records = dataframe_to_records(normalize_columns(chunk))
+        chunk_progress = None
+        if progress_callback:
+            chunk_progress = lambda done, total, offset=rows_done: progress_callback(offset + done, total_rows)
+        chunk_stats, chunk_failed = upload_batches(table_name, records, batch_size, max_workers, chunk_progress)
+        for status in chunk_stats:
+            batch_stats.append({**status, "batch": len(batch_stats) + 1})
+        failed_records.extend(chunk_failed)
+        rows_done += len(records)
+
+    return log_upload_summary(table_name, batch_stats, failed_records, time.perf_counter() - started_at)
+
+# Function to list the sheets of an uploaded workbook without loading its cells
+def get_excel_sheet_names(uploaded_file):
+    uploaded_file.seek(0)
+    workbook = load_workbook(uploaded_file, read_only=True)
+    try:
+        return workbook.sheetnames
+    finally:
+        workbook.close()
+
+# Function to render a worksheet cell as text, writing whole numbers without a trailing .0
+def cell_text(value):
+    if value is None:
+        return None
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+# Function to name worksheet columns the way pd.read_excel does: 'Unnamed: n' for blank headers and .1, .2 suffixes
+# for repeated ones
+def excel_column_names(header, width):
+    header = tuple(header) + (None,) * (width - len(header))
+    names = [str(value) if value is not None else f"Unnamed: {i}" for i, value in enumerate(header)]
+    taken = set(names)
+    counts = {}
+    # Named columns are numbered first and a suffix never reuses a name already in the header, as in pandas
+    for i in [i for i, value in enumerate(header) if value is not None] + [i for i, value in enumerate(header) if value is None]:
+        base = name = names[i]
+        count = counts.get(base, 0)
+        while count:
+            counts[base] = count + 1
+            name = f"{base}.{count}"
+            count = count + 1 if name in taken else counts.get(name, 0)
+        names[i] = name
+        taken.add(name)
+        counts[name] = count + 1
+    return names
+
+# Function to get the number of the last filled cell of a worksheet row
+def filled_width(row):
+    return max((i + 1 for i, value in enumerate(row) if value is not None), default=0)
+
+# Function to read a worksheet row by row in read-only mode, yielding DataFrame chunks
+def read_excel_chunks(uploaded_file, sheet_name=None, chunksize=None):
+    uploaded_file.seek(0)
+    workbook = load_workbook(uploaded_file, read_only=True, data_only=True)
+    try:
+        worksheet = workbook[sheet_name] if sheet_name else workbook.active
+        rows = worksheet.iter_rows(values_only=True)
+        header = next(rows, ())
+        header = header[:filled_width(header)]
+        width = len(header)
+        if worksheet.max_column is None or worksheet.max_column > width:
+            # Cells may sit to the right of the header; find the widest row first so none of them is dropped
+            width = max([width] + [filled_width(row) for row in worksheet.iter_rows(min_row=2, values_only=True)])
+            rows = worksheet.iter_rows(min_row=2, values_only=True)
+        columns = excel_column_names(header, width)
+        chunk = []
+        chunks_read = 0
+        for row in rows:
+            # Skip fully empty rows and pad short rows to the sheet width
+            if all(value is None for value in row):
+                continue
+            chunk.append(tuple(cell_text(value) for value in row[:width]) + (None,) * (width - len(row)))
+            if chunksize and len(chunk) >= chunksize:
+                yield pd.DataFrame(chunk, columns=columns)
+                chunks_read += 1
+                chunk = []
+        if chunk or not chunks_read:
+            yield pd.DataFrame(chunk, columns=columns)
+    finally:
+        workbook.close()
+
+# Function to read an uploaded file as a stream of text DataFrame chunks (a single chunk when chunksize is None);
+# pandas would infer types per chunk, so a later chunk could send 3 as '3.0'
+def read_upload_chunks(uploaded_file, chunksize=None, sheet_name=None):
+    uploaded_file.seek(0)
+    if uploaded_file.name.endswith('.csv'):
+        if chunksize:
+            yield from pd.read_csv(uploaded_file, chunksize=chunksize, dtype=str)
+        else:
+            yield pd.read_csv(uploaded_file, dtype=str)
+    else:
+        yield from read_excel_chunks(uploaded_file, sheet_name, chunksize)
+
+# Function to open an upload as a chunk stream, asking for the worksheet when it is a workbook
+def open_upload(uploaded_file, chunksize=None):
+    sheet_name = None
+    if not uploaded_file.name.endswith('.csv'):
+        sheet_name = st.selectbox("Sheet:", get_excel_sheet_names(uploaded_file))
+    return read_upload_chunks(uploaded_file, chunksize, sheet_name)
+
+# Function to report insert progress in the UI
+def streamlit_progress_callback(label, uploaded_file=None):
+    progress_bar = st.progress(0.0, text=label)
+
+    def update(done, total):
+        if total is None and uploaded_file is not None:
+            # Total rows are unknown while streaming, so follow the read position in the file
+            progress_bar.progress(min(uploaded_file.tell() / max(uploaded_file.size, 1), 1.0), text=f"{label} {done}")
+        else:
+            progress_bar.progress(min(done / total, 1.0) if total else 1.0, text=f"{label} {done}/{total}")
+
+    return update
+
+# Function to show the upload summary and remember rows that still need to be inserted
+def show_upload_summary(table_name, summary):
+    if summary["rows_failed"]:
+        st.session_state["failed_upload"] = {"table": table_name, "records": summary["failed_records"]}
+        st.warning(f"{summary['rows_ok']} records inserted, {summary['rows_failed']} records failed. "
+                   "Use 'Retry failed batches' to send only the failed rows again.")
+    else:
+        st.session_state.pop("failed_upload", None)
+    st.caption(f"{summary['rows_ok']} rows in {summary['elapsed_seconds']}s ({summary['rows_per_second']} rows/s)")
+    st.dataframe(pd.DataFrame(summary["batches"]))
+    return not summary["rows_failed"]
+
+# Function to count the rows of a table
+def count_table_rows(table_name):
+    result = execute_sql(f"SELECT COUNT(*) AS row_count FROM {table_name}")
+    return int(result[0]["row_count"]) if result else 0
+
+# Audit column filled by create_raw_table, used as the incremental refresh high-water mark
+AUDIT_CREATED_COLUMN = "CREATED_AT"
+
+# Newest audit timestamp that is safe to use as a mark. CREATED_AT is the inserting transaction's start time, so a
+# batch still in flight can commit rows older than MAX(CREATED_AT); the mark stops just before the oldest open transaction
+HIGH_WATER_MARK_QUERY = """
+SELECT LEAST(
+	MAX({column}),
+	(SELECT MIN(xact_start) - interval '1 microsecond' FROM pg_stat_activity
+	 WHERE backend_type = 'client backend' AND state <> 'idle' AND pid <> pg_backend_pid())
+) AS high_water_mark
+FROM {table}
+"""
+
+# The refresh state table (meta_indicator_refresh_state, the high-water mark of every incrementally refreshed indicator)
+# ships as supabase/migrations/20261016120300_indicator_refresh_state.sql
+
+# Function to find the source table of an indicator that can be refreshed by appending new rows
+def get_incremental_source_table(query):
+    # Only single-table indicators without aggregation qualify, and the source needs the audit column
+    match = re.search(r"^FROM (\w+)$", query, re.M)
+    if not match or re.search(r"\b(JOIN|GROUP BY|DISTINCT)\b", query, re.I):
+        return None
+    source_table = match.group(1)
+    columns = [col['column_name'].lower() for col in get_table_columns(source_table)]
+    return source_table if AUDIT_CREATED_COLUMN.lower() in columns else None
+
+# Function to restrict the indicator source table to a window of the audit column
+def bound_source_table(query, source_table, low_mark, high_mark):
+    conditions = [f"({AUDIT_CREATED_COLUMN} IS NULL OR {AUDIT_CREATED_COLUMN} <= {sql_literal(high_mark)})"]
+    if low_mark is not None:
+        conditions = [f"{AUDIT_CREATED_COLUMN} > {sql_literal(low_mark)}", f"{AUDIT_CREATED_COLUMN} <= {sql_literal(high_mark)}"]
+    bounded = f"(SELECT * FROM {source_table} WHERE {' AND '.join(conditions)}) AS {source_table}"
+    return query.replace(f"FROM {source_table}\n", f"FROM {bounded}\n", 1)
+
+# Function to materialize an indicator into its indicator_* table, appending only new source rows when possible
+def materialize_indicator(target_table, query, full_refresh=False):
+    exists = target_table in get_all_tables()
+    source_table = get_incremental_source_table(query)
+    high_mark = None
+    low_mark = None
+    if source_table:
+        high_mark = execute_sql(HIGH_WATER_MARK_QUERY.format(column=AUDIT_CREATED_COLUMN, table=source_table))[0]["high_water_mark"]
+        if exists and not full_refresh:
+            state = execute_sql(
+                "SELECT high_water_mark FROM meta_indicator_refresh_state "
+                f"WHERE target_table = {sql_literal(target_table)} AND source_table = {sql_literal(source_table)}"
+            )
+            low_mark = state[0]["high_water_mark"] if state else None
+
+    if high_mark is None or low_mark is None:
+        # No usable high-water mark: rebuild the whole table, dropping it first so a changed column set still fits,
+        # and forget the marks of any previous definition
+        rebuild_query = bound_source_table(query, source_table, None, high_mark) if high_mark is not None else query
+        materialize_query = (
+            f"DROP TABLE IF EXISTS {target_table};\nCREATE TABLE {target_table} AS\n{rebuild_query};\n"
+            f"DELETE FROM meta_indicator_refresh_state WHERE target_table = {sql_literal(target_table)};"
+        )
+    elif high_mark == low_mark:
+        # Nothing was created in the source table since the last refresh
+        return count_table_rows(target_table), "-- no new rows since " + str(low_mark)
+    else:
+        # Append only the rows created since the last refresh
+        materialize_query = f"INSERT INTO {target_table}\n{bound_source_table(query, source_table, low_mark, high_mark)};"
+
+    if high_mark is not None:
+        materialize_query += (
+            "\nINSERT INTO meta_indicator_refresh_state (target_table, source_table, high_water_mark) "
+            f"VALUES ({sql_literal(target_table)}, {sql_literal(source_table)}, {sql_literal(high_mark)}) "
+            "ON CONFLICT (target_table, source_table) DO UPDATE "
+            "SET high_water_mark = GREATEST(meta_indicator_refresh_state.high_water_mark, EXCLUDED.high_water_mark), "
+            "refreshed_at = current_timestamp;"
+        )
+    execute_sql_2(materialize_query)
+    invalidate_schema_cache(target_table)
+    invalidate_query_results(f"SELECT * FROM {target_table}")
+    return count_table_rows(target_table), materialize_query
+
+# Function to drop an indicator's stored table and refresh state, so dashboards run its query again
+def drop_indicator_table(target_table):
+    execute_sql_2(
+        f"DROP TABLE IF EXISTS {target_table};\n"
+        f"DELETE FROM meta_indicator_refresh_state WHERE target_table = {sql_literal(target_table)};"
+    )
+    invalidate_schema_cache(target_table)
+    invalidate_query_results(f"SELECT * FROM {target_table}")
+
+# Function to list the join and filter columns that no existing index leads with
+def advise_indexes(joins, filters, tables_metadata):
+    indexed = {
+        (table, col["column_name"])
+        for table, columns in tables_metadata.items() for col in columns if col.get("indexes")
+    }
+    keys = [(join["left_table"], join["left_column"]) for join in joins]
+    keys += [(join["right_table"], join["right_column"]) for join in joins]
+    # LIKE '%...%' cannot use a B-tree index, so those filters are skipped
+    keys += [(f["table"], f["column"]) for f in filters if f["operator"] != "LIKE"]
+    return [key for key in dict.fromkeys(keys) if key not in indexed and key[0] in tables_metadata]
+
+# Function to create the advised B-tree indexes, logging each one in the lineage table
+def create_advised_indexes(index_keys):
+    created = []
+    for table_name, column in index_keys:
+        # The hash keeps names distinct when they are cut to 63 characters or when idx_a_b_c could mean a_b.c or a.b_c
+        name_hash = hashlib.md5(f"{table_name}.{column}".encode("utf-8")).hexdigest()[:8]
+        index_name = f"idx_{table_name}_{column}"[:54] + "_" + name_hash
+        index_query = f"CREATE INDEX IF NOT EXISTS {index_name} ON {table_name} USING btree ({column});"
+        execute_sql_2(index_query)
+        invalidate_schema_cache(table_name)
+        log_data_lineage(table_name, table_name, 0, "index", index_query)
+        created.append(index_name)
+    return created
+
+# The compiled_query and query_params columns of metadata_mappings ship as
+# supabase/migrations/20261016120100_query_model_columns.sql
+
+# Function to split an IN / NOT IN value into its items; items may be quoted ('a, b', 'O''Brien') to hold commas or quotes
+def parse_list_value(text):
+    return [v.strip() for v in next(csv.reader([str(text)], quotechar="'", skipinitialspace=True), []) if v.strip()]
+
+# Function to write list items back as an IN / NOT IN value that parse_list_value reads the same way
+def format_list_value(values):
+    return ", ".join("'" + str(v).replace("'", "''") + "'" if re.search(r"[,']", str(v)) else str(v) for v in values)
+
+# Function to compile an indicator query model (tables, columns, joins, filters, orders) into SQL with $n parameters
+def compile_query(model):
+    params = []
+
+    def bind(value):
+        params.append(value)
+        return f"${len(params)}"
+
+    # A column name already in the output is aliased with its table (t2.id AS t2_id), so CREATE TABLE AS accepts it
+    output_columns, select_list = set(), []
+    for table, col in model["columns"]:
+        name = col
+        if name in output_columns:
+            name = f"{table}_{col}"
+            for n in itertools.count(2):
+                if name not in output_columns:
+                    break
+                name = f"{table}_{col}_{n}"
+        output_columns.add(name)
+        select_list.append(f"{table}.{col}" if name == col else f"{table}.{col} AS {name}")
+    query = "SELECT " + ", ".join(select_list) + "\n"
+    query += f"FROM {model['tables'][0]}\n"
+    for join in model["joins"]:
+        query += f"{join['type']} {join['right_table']} ON {join['left_table']}.{join['left_column']} = {join['right_table']}.{join['right_column']}\n"
+    if model["filters"]:
+        filter_conditions = []
+        for f in model["filters"]:
+            column = f"{f['table']}.{f['column']}"
+            if f["operator"] in ["IN", "NOT IN"]:
+                values = parse_list_value(f["value"])
+                comparison = "= ANY" if f["operator"] == "IN" else "<> ALL"
+                filter_conditions.append(f"{column} {comparison}({bind(values)})")
+            elif f["operator"] == "LIKE":
+                filter_conditions.append(f"{column} LIKE {bind('%' + f['value'] + '%')}")
+            else:
+                filter_conditions.append(f"{column} {f['operator']} {bind(f['value'])}")
+        query += "WHERE " + " AND ".join(filter_conditions) + "\n"
+    if model["orders"]:
+        query += "ORDER BY " + ", ".join(f"{o['table']}.{o['column']} {o['direction']}" for o in model["orders"])
+    return query, params
+
+# Function to render a list parameter as a Postgres array literal
+def sql_array_literal(values):
+    return "{" + ",".join('"' + str(v).replace("\\", "\\\\").replace('"', '\\"') + '"' for v in values) + "}"
+
+# Function to inline the parameters of a compiled query as SQL literals, for display and the plain RPC
+def render_query(query, params):
+    def literal(match):
+        value = params[int(match.group(1)) - 1]
+        return sql_literal(sql_array_literal(value) if isinstance(value, list) else value)
+    return re.sub(r"\$(\d+)", literal, query)
+
+# Query guard configuration (planner cost units above which Test Query asks for confirmation)
+QUERY_COST_CONFIRM_THRESHOLD = float(st.secrets.get("QUERY_COST_CONFIRM_THRESHOLD", 1000000))
+QUERY_TIMEOUT_SECONDS = int(st.secrets.get("QUERY_TIMEOUT_SECONDS", 30))
+
+# The query guard's server-side helpers (explain_sql, execute_sql_tagged, execute_sql_prepared, cancel_tagged_query)
+# ship as supabase/migrations/20261016120000_query_guard_functions.sql; until it is applied, reads fall back to
+# execute_sql and EXPLAIN is skipped
+
+# Function to get the planner's estimated rows and cost for a query, or None when EXPLAIN is unavailable
+def explain_query(query):
+    query = query.strip().rstrip(";")
+
+    def load_plan():
+        try:
+            plan = supabase.rpc("explain_sql", {"query": query}).execute().data
+        except Exception:
+            return None
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        top = plan[0]["Plan"]
+        return {"rows": int(top["Plan Rows"]), "cost": float(top["Total Cost"])}
+    return get_result_cache().get(("plan", query_cache_key(query)[1]), load_plan)
+
+# Function to run a read query with a deadline, cancelling it on the server when the deadline passes
+# (the runners also carry a 300 s server-side statement_timeout, which bounds calls without a deadline)
+def execute_sql_with_timeout(query, params=None, timeout_seconds=QUERY_TIMEOUT_SECONDS):
+    tag = f"query-guard-{uuid.uuid4().hex}"
+    if params:
+        rpc_name, rpc_params = "execute_sql_prepared", {
+            "query": query, "tag": tag,
+            "params": [sql_array_literal(value) if isinstance(value, list) else value for value in params]
+        }
+    else:
+        rpc_name, rpc_params = "execute_sql_tagged", {"query": query, "tag": tag}
+    pool = ThreadPoolExecutor(max_workers=1)
+    future = pool.submit(lambda: supabase.rpc(rpc_name, rpc_params).execute().data)
+    pool.shutdown(wait=False)
+    try:
+        return future.result(timeout=timeout_seconds)
+    except FutureTimeoutError:
+        supabase.rpc("cancel_tagged_query", {"tag": tag}).execute()
+        raise TimeoutError(f"Query cancelled after {timeout_seconds}s (statement timeout)")
+    except Exception as e:
+        if getattr(e, "code", None) == "PGRST202":  # The runner is not visible to the API yet (schema cache reload pending)
+            return execute_sql(render_query(query, params) if params else query)
+        raise
+
+# Columnar transport: results come back as one array per column instead of one dict per row (off by default)
+COLUMNAR_RESULTS = str(st.secrets.get("COLUMNAR_RESULTS", "false")).lower() in ("1", "true", "yes")
+
+# Wrapper that pivots any result into a single {column: [values]} JSON object, keeping column and row order; columns
+# are grouped by position, so duplicate names (t1.id, t2.id) never merge into one array twice as long as the others
+COLUMNAR_RESULT_QUERY = """SELECT json_object_agg(column_name, column_values ORDER BY column_position) AS columns
+FROM (
+	SELECT MIN(cell.key) AS column_name,
+	       json_agg(cell.value ORDER BY source.row_index) AS column_values,
+	       cell.ordinality AS column_position
+	FROM (
+		SELECT row_to_json(columnar_source) AS row_json, row_number() OVER () AS row_index
+		FROM (
+{query}
+		) AS columnar_source
+	) AS source,
+	json_each(source.row_json) WITH ORDINALITY AS cell(key, value, ordinality)
+	GROUP BY cell.ordinality
+) AS columnar_columns"""
+# Postgres error codes meaning the query cannot sit inside the wrapper's subquery (e.g. it is not a single SELECT)
+COLUMNAR_UNSUPPORTED_CODES = {"42601"}
+
+# Function to run a read query and return its data ready for pd.DataFrame: column arrays when COLUMNAR_RESULTS is set,
+# row dicts otherwise or when the query cannot be wrapped or returns columns of different lengths; timeouts and
+# errors of the query itself are raised, not retried
+def fetch_query_data(query, params=None, timeout_seconds=QUERY_TIMEOUT_SECONDS):
+    if COLUMNAR_RESULTS:
+        try:
+            rows = execute_sql_with_timeout(
+                COLUMNAR_RESULT_QUERY.format(query=query.strip().rstrip(";")), params, timeout_seconds
+            )
+            columns = (rows[0].get("columns") if rows else None) or {}
+            if len({len(values) for values in columns.values()}) <= 1:
+                return columns
+        except Exception as e:
+            if getattr(e, "code", None) not in COLUMNAR_UNSUPPORTED_CODES:
+                raise
+    return execute_sql_with_timeout(query, params, timeout_seconds)
+
+# Function to wrap a query so the server returns a single page of its rows; returns the paged query and its parameters
+def paginate_query(query, page_size, page, params=None):
+    query = query.strip().rstrip(";")
+    limit, offset = int(page_size), int(page) * int(page_size)
+    if params:
+        # Bind LIMIT/OFFSET too, so every page of a compiled query shares one prepared statement
+        return (f"SELECT * FROM (\n{query}\n) AS paged_query\nLIMIT ${len(params) + 1} OFFSET ${len(params) + 2}",
+                list(params) + [limit, offset])
+    return f"SELECT * FROM (\n{query}\n) AS paged_query\nLIMIT {limit} OFFSET {offset}", params
+
+# Function to count the rows of a query up to a cap, returning the count and whether the cap was hit
+def estimate_query_rows(query, cap=COUNT_ESTIMATE_CAP, params=None):
+    query = query.strip().rstrip(";")
+    result = execute_sql_with_timeout(
+        f"SELECT COUNT(*) AS row_count FROM (SELECT 1 FROM (\n{query}\n) AS counted_query LIMIT {cap + 1}) AS capped_query",
+        params
+    )
+    row_count = int(result[0]["row_count"]) if result else 0
+    return min(row_count, cap), row_count > cap
+
+# Function to load one page of a query result through the result cache
+def get_query_page(query, page, page_size=PAGE_SIZE, params=None):
+    paged_query, paged_params = paginate_query(query, page_size, page, params)
+    page_key = ("page", query_cache_key(query, params)[1], int(page), int(page_size))
+    return get_result_cache().get(page_key, lambda: result_dataframe(query, fetch_query_data(paged_query, paged_params)))
+
+# Function to show a query result one page at a time, loading each page on demand
+def show_paginated_result(query, key, page_size=PAGE_SIZE, params=None):
+    count_key = ("count", query_cache_key(query, params)[1])
+    total_rows, capped = get_result_cache().get(count_key, lambda: estimate_query_rows(query, params=params))
+    pages = max(1, math.ceil(total_rows / page_size))
+    page = st.number_input(
+        f"Page (of {pages}{'+' if capped else ''}):",
+        min_value=1, max_value=None if capped else pages, value=1, key=key
+    ) - 1
+    df_page = get_query_page(query, page, page_size, params)
+    first_row = page * page_size + 1
+    st.caption(f"Rows {first_row}-{first_row + len(df_page) - 1} of {'more than ' if capped else ''}{total_rows}")
+    st.dataframe(df_page)
+    return df_page, total_rows
+
+# Function to wrap a query in a GROUP BY so only the aggregated chart rows leave the database
+def aggregate_query(query, group_column, value_column, aggregation="SUM"):
+    query = query.strip().rstrip(";")
+    group_sql = '"' + group_column.replace('"', '""') + '"'
+    value_sql = '"' + value_column.replace('"', '""') + '"'
+    measure = f"COUNT({value_sql})" if aggregation == "COUNT" else f"{aggregation}({value_sql}::numeric)"
+    return (
+        f"SELECT {group_sql}, {measure} AS {value_sql}\n"
+        f"FROM (\n{query}\n) AS chart_source\n"
+        f"GROUP BY {group_sql}\nORDER BY {group_sql}"
+    )
+
+# Function to load the aggregated chart rows of a query through the result cache
+def get_aggregated_result(query, group_column, value_column, aggregation="SUM", params=None):
+    chart_key = ("chart", query_cache_key(query, params)[1], group_column, value_column, aggregation)
+
+    def load_aggregate():
+        df = pd.DataFrame(fetch_query_data(aggregate_query(query, group_column, value_column, aggregation), params) or [])
+        if value_column in df.columns:
+            df[value_column] = pd.to_numeric(df[value_column], errors="coerce")
+        return df
+    return get_result_cache().get(chart_key, load_aggregate)
+
+# Function to downsample a line series by keeping the min and max point of each x-ordered bucket (evenly spaced rows
+# when Y is not numeric)
+def downsample_series(df, x_column, y_column, point_budget=LINE_CHART_POINT_BUDGET):
+    df = df.sort_values(x_column, kind="stable", ignore_index=True)
+    if len(df) <= point_budget:
+        return df
+    y = pd.to_numeric(df[y_column], errors="coerce").to_numpy(dtype=float)
+    valid = np.flatnonzero(~np.isnan(y))
+    if len(valid) < df[y_column].notna().sum():
+        # Y is not numeric, so there is no min/max to keep; take evenly spaced rows instead
+        return df.iloc[np.unique(np.linspace(0, len(df) - 1, point_budget).astype(int))]
+    if len(valid) <= point_budget:
+        return df.iloc[valid]
+    buckets = np.arange(len(valid)) * max(1, point_budget // 2) // len(valid)
+    # Sorting by (bucket, y) puts each bucket's min first and its max last
+    order = valid[np.lexsort((y[valid], buckets))]
+    starts = np.flatnonzero(np.diff(buckets, prepend=-1))
+    ends = np.append(starts[1:] - 1, len(valid) - 1)
+    keep = np.unique(np.concatenate([order[starts], order[ends], valid[[0, -1]]]))
+    return df.iloc[keep]
+
+# Function to let the user change the filter values bound to a compiled indicator query
+def edit_query_params(compiled_query, params, key):
+    if not params:
+        return params
+    with st.expander("Filter values"):
+        st.code(compiled_query)
+        edited = []
+        for i, value in enumerate(params, start=1):
+            if isinstance(value, list):
+                text = st.text_input(f"${i} (comma-separated):", format_list_value(value), key=f"{key}_param_{i}")
+                edited.append(parse_list_value(text))
+            else:
+                edited.append(st.text_input(f"${i}:", str(value), key=f"{key}_param_{i}"))
+    return edited
+
+# Export configuration (rows fetched per page while streaming an export to disk)
+EXPORT_PAGE_SIZE = int(st.secrets.get("EXPORT_PAGE_SIZE", 50000))
+EXPORT_ROW_COLUMN = "meta_export_row"
+EXPORT_TABLE_PREFIX = "meta_export_"
+EXPORT_DIR = os.path.join(tempfile.gettempdir(), "metadata_platform_exports")
+EXPORT_FILE_MAX_AGE = int(st.secrets.get("EXPORT_FILE_MAX_AGE", 3600))  # Seconds an export file is kept for download
+EXPORT_FORMATS = {
+    "CSV": (".csv", "text/csv"),
+    "XLSX": (".xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+}
+if pq is not None:
+    EXPORT_FORMATS["Parquet"] = (".parquet", "application/vnd.apache.parquet")
+
+# Function to run a query once into a snapshot table numbered by row, so an export reads one consistent, ordered result
+def create_export_snapshot(query, params=None):
+    # The creation time in the name lets remove_stale_export_tables find snapshots left behind by a dead session
+    snapshot_table = f"{EXPORT_TABLE_PREFIX}{int(time.time())}_{uuid.uuid4().hex}"
+    query = (render_query(query, params) if params else query).strip().rstrip(";")
+    execute_sql_2(
+        f"CREATE TABLE {snapshot_table} AS\n"
+        f"SELECT row_number() OVER () AS {EXPORT_ROW_COLUMN}, export_source.*\nFROM (\n{query}\n) AS export_source;\n"
+        f"ALTER TABLE {snapshot_table} ADD PRIMARY KEY ({EXPORT_ROW_COLUMN});"
+    )
+    return snapshot_table
+
+# Function to stream a query result page by page from its snapshot (keyset on the row number), holding one page at a time
+def iter_query_pages(query, params=None, page_size=EXPORT_PAGE_SIZE):
+    snapshot_table = create_export_snapshot(query, params)
+    try:
+        # Column types of the snapshot, used to type the Parquet schema
+        data_types = {
+            row["column_name"]: row["data_type"]
+            for row in execute_sql(SCHEMA_METADATA_QUERY.format(table_filter=f" AND c.table_name = {sql_literal(snapshot_table)}")) or []
+        }
+        last_row = 0
+        while True:
+            data = fetch_query_data(
+                f"SELECT * FROM {snapshot_table}\nWHERE {EXPORT_ROW_COLUMN} > {last_row}\n"
+                f"ORDER BY {EXPORT_ROW_COLUMN}\nLIMIT {int(page_size)}",
+                timeout_seconds=None
+            ) or []
+            if isinstance(data, list):
+                data = {col: [row.get(col) for row in data] for col in (data[0] if data else [])}
+            # Object columns keep each value as returned (pandas would turn 1 into 1.0 next to a 3.0)
+            df = pd.DataFrame({col: pd.Series(values, dtype=object) for col, values in data.items()})
+            if df.empty:
+                return
+            last_row = int(df[EXPORT_ROW_COLUMN].iloc[-1])
+            df = df.drop(columns=EXPORT_ROW_COLUMN)
+            df.attrs["data_types"] = data_types
+            yield df
+            if len(df) < page_size:
+                return
+    finally:
+        execute_sql_2(f"DROP TABLE IF EXISTS {snapshot_table};")
+
+# Function to make a raw page writable by every export format (JSON values as text, everything else as returned)
+def export_frame(df):
+    for col in df.columns:
+        df[col] = pd.Series(
+            [json.dumps(value) if isinstance(value, (dict, list)) else value for value in df[col]], index=df.index, dtype=object
+        )
+    return df
+
+# Function to map a Postgres column type to the Parquet type its exported values are written as
+def parquet_type(data_type):
+    if data_type in ("smallint", "integer", "bigint"):
+        return pa.int64()
+    if data_type in ("real", "double precision", "numeric"):
+        return pa.float64()
+    if data_type == "boolean":
+        return pa.bool_()
+    return pa.string()
+
+# Function to delete export files older than the maximum age, whichever session prepared them
+def remove_stale_exports(max_age=EXPORT_FILE_MAX_AGE):
+    if not os.path.isdir(EXPORT_DIR):
+        return
+    cutoff = time.time() - max_age
+    for entry in os.scandir(EXPORT_DIR):
+        try:
+            if entry.is_file() and entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+        except FileNotFoundError:  # Another session removed it first
+            pass
+
+# Function to drop export snapshot tables older than the maximum age, e.g. left behind when a session died mid-export
+def remove_stale_export_tables(max_age=EXPORT_FILE_MAX_AGE):
+    rows = execute_sql(
+        f"SELECT tablename FROM pg_tables WHERE schemaname = 'public' AND starts_with(tablename, {sql_literal(EXPORT_TABLE_PREFIX)})"
+    ) or []
+    cutoff = time.time() - max_age
+    stale = []
+    for row in rows:
+        created = row["tablename"][len(EXPORT_TABLE_PREFIX):].split("_")[0]
+        # Snapshots named before the timestamp was added have no creation time and are always stale
+        if not created.isdigit() or int(created) < cutoff:
+            stale.append(row["tablename"])
+    if stale:
+        execute_sql_2("".join(f"DROP TABLE IF EXISTS {table};" for table in stale))
+
+# Function to read an export file when its download is clicked
+def read_export_file(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+# Function to write a query result to a temporary file in the chosen format, one page at a time; returns the file path
+def export_query(query, export_format, params=None, progress_callback=None, total_rows=None):
+    suffix = EXPORT_FORMATS[export_format][0]
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    with tempfile.NamedTemporaryFile(suffix=suffix, dir=EXPORT_DIR, delete=False) as export_file:
+        path = export_file.name
+    rows = 0
+    pages = (export_frame(df) for df in iter_query_pages(query, params))
+    if export_format == "CSV":
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            for df in pages:
+                df.to_csv(f, header=not rows, index=False)
+                rows += len(df)
+                if progress_callback:
+                    progress_callback(rows, total_rows)
+    elif export_format == "Parquet":
+        writer = None
+        try:
+            for df in pages:
+                if writer is None:
+                    schema = pa.schema([(col, parquet_type(df.attrs["data_types"].get(col))) for col in df.columns])
+                    writer = pq.ParquetWriter(path, schema, compression="zstd")
+                writer.write_table(pa.Table.from_pydict(
+                    {col: pa.array(df[col].tolist(), type=schema.field(col).type) for col in df.columns}, schema=schema
+                ))
+                rows += len(df)
+                if progress_callback:
+                    progress_callback(rows, total_rows)
+        finally:
+            if writer is not None:
+                writer.close()
+    else:
+        workbook = Workbook(write_only=True)
+        worksheet = workbook.create_sheet()
+        for df in pages:
+            if not rows:
+                worksheet.append(list(df.columns))
+            for row in df.where(df.notna(), None).itertuples(index=False, name=None):
+                worksheet.append(row)
+            rows += len(df)
+            if progress_callback:
+                progress_callback(rows, total_rows)
+        workbook.save(path)
+    return path
 
 # User Interface
 def main():
@@ -140,12 +1462,46 @@ def main():
     elif menu == "Dashboards":
         dashboards_page()
 
+    # Schema cache counters
+    schema_stats = get_schema_cache().stats()
+    st.sidebar.caption(f"Schema cache: {schema_stats['hits']} hits, {schema_stats['misses']} misses, {schema_stats['entries']} entries")
+    result_stats = get_result_cache().stats()
+    st.sidebar.caption(f"Result cache: {result_stats['hits']} hits, {result_stats['misses']} misses, "
+                       f"{result_stats['entries']} entries, {result_stats['bytes'] / 1024 / 1024:.1f} MB "
+                       f"({result_stats['raw_bytes'] / 1024 / 1024:.1f} MB before compaction)")
+    lineage_stats = get_lineage_writer().stats()
+    st.sidebar.caption(f"Lineage queue: {lineage_stats['pending']} pending, {lineage_stats['written']} written, "
+                       f"{lineage_stats['failed']} failed")
+
 def data_entry_page():
     st.title("Data Entry")
     
     # Get list of existing tables
     tables = get_all_tables()
     raw_tables = [t for t in tables if t.startswith('raw_')]
+
+    # Upload settings
+    with st.expander("Upload settings"):
+        batch_size = st.number_input("Rows per batch:", min_value=100, max_value=50000, value=INSERT_BATCH_SIZE, step=100)
+        max_workers = st.number_input("Parallel uploads:", min_value=1, max_value=16, value=INSERT_MAX_WORKERS)
+        streaming = st.checkbox("Streaming mode (read large files in chunks)")
+        chunk_size = st.number_input("Rows per chunk:", min_value=1000, max_value=1000000, value=UPLOAD_CHUNK_SIZE,
+                                     step=1000, disabled=not streaming)
+
+    # Retry rows left over from a partially failed upload
+    failed_upload = st.session_state.get("failed_upload")
+    if failed_upload:
+        st.warning(f"{len(failed_upload['records'])} records from the last upload to {failed_upload['table']} were not inserted.")
+        if st.button("Retry failed batches"):
+            with st.spinner("Inserting data..."):
+                summary = insert_records_to_table(
+                    failed_upload["table"], failed_upload["records"],
+                    batch_size=batch_size,
+                    max_workers=max_workers,
+                    progress_callback=streamlit_progress_callback("Inserted rows:")
+                )
+                if show_upload_summary(failed_upload["table"], summary):
+                    st.success(f"Data inserted successfully! {summary['rows_ok']} records added.")
     
     # Option to select existing table or create new one
     option = st.radio("Choose an option:", ["Insert into existing table", "Create new table"])
@@ -162,18 +1518,24 @@ def data_entry_page():
         
         if uploaded_file is not None:
             try:
-                if uploaded_file.name.endswith('.csv'):
-                    df = pd.read_csv(uploaded_file)
-                else:
-                    df = pd.read_excel(uploaded_file)
+                # Only the first chunk is held for the preview; the rest is read while inserting
+                chunks = open_upload(uploaded_file, chunk_size if streaming else None)
+                df = next(chunks)
                 
                 st.write("Data preview:")
                 st.dataframe(df.head())
                 
                 if st.button("Insert Data"):
                     with st.spinner("Inserting data..."):
-                        result = insert_data_to_table(selected_table, df)
-                        st.success(f"Data inserted successfully! {len(df)} records added.")
+                        result = insert_chunks_to_table(
+                            selected_table, itertools.chain([df], chunks),
+                            batch_size=batch_size,
+                            max_workers=max_workers,
+                            progress_callback=streamlit_progress_callback("Inserted rows:", uploaded_file),
+                            total_rows=None if streaming else len(df)
+                        )
+                        if show_upload_summary(selected_table, result):
+                            st.success(f"Data inserted successfully! {result['rows_ok']} records added.")
             except Exception as e:
                 st.error(f"Error processing file: {str(e)}")
     
@@ -188,27 +1550,59 @@ def data_entry_page():
         
         if uploaded_file is not None and new_table_name.startswith('raw_'):
             try:
-                if uploaded_file.name.endswith('.csv'):
-                    df = pd.read_csv(uploaded_file)
-                else:
-                    df = pd.read_excel(uploaded_file)
+                # Only the first chunk is held for the preview; the rest is read while inserting
+                chunks = open_upload(uploaded_file, chunk_size if streaming else None)
+                df = next(chunks)
                 
                 st.write("Data preview:")
                 st.dataframe(df.head())
                 
+                # Propose a type per column; the user can override any of them before the table is created
+                normalize_columns(df)
+                # Streaming mode only sees the first chunk, and a type it fits may not fit later rows, so columns stay TEXT
+                # unless the user picks a type
+                if streaming:
+                    proposed_types = {col: "TEXT" for col in df.columns}
+                    st.caption("Streaming mode: columns default to TEXT because only the first chunk can be profiled.")
+                else:
+                    proposed_types = profile_column_types(df)
+                st.write("Column types:")
+                edited_types = st.data_editor(
+                    pd.DataFrame({"column": list(proposed_types), "type": list(proposed_types.values())}),
+                    column_config={
+                        "column": st.column_config.TextColumn("Column", disabled=True),
+                        "type": st.column_config.SelectboxColumn("Type", options=COLUMN_TYPES, required=True)
+                    },
+                    hide_index=True, key="column_types_editor"
+                )
+                column_types = dict(zip(edited_types["column"], edited_types["type"]))
+                
+                # The bulk load sends the whole file in one request, which streaming mode exists to avoid
+                bulk_load = st.checkbox("Fast bulk load (create the table and load all rows in one transaction)", disabled=streaming)
+                
                 if st.button("Create Table and Insert Data"):
                     with st.spinner("Creating table and inserting data..."):
                         # Check if table already exists
                         if new_table_name in tables:
                             st.error(f"Table {new_table_name} already exists!")
+                        elif bulk_load and not streaming:
+                            # Create table and load data in a single server-side call
+                            insert_result = create_raw_table_with_data(new_table_name, itertools.chain([df], chunks), column_types)
                         else:
                             # Create table
-                            create_result = create_raw_table(new_table_name, df)
+                            create_result = create_raw_table(new_table_name, df, column_types)
                             
                             # Insert data
-                            insert_result = insert_data_to_table(new_table_name, df)
-                            
-                            st.success(f"Table {new_table_name} created and {len(df)} records inserted successfully!")
+                            insert_result = insert_chunks_to_table(
+                                new_table_name, itertools.chain([df], chunks),
+                                batch_size=batch_size,
+                                max_workers=max_workers,
+                                progress_callback=streamlit_progress_callback("Inserted rows:", uploaded_file),
+                                total_rows=None if streaming else len(df)
+                            )
+                        
+                        if new_table_name not in tables and show_upload_summary(new_table_name, insert_result):
+                            st.success(f"Table {new_table_name} created and {insert_result['rows_ok']} records inserted successfully!")
             except Exception as e:
                 st.error(f"Error processing file: {str(e)}")
 
@@ -229,10 +1623,10 @@ def indicator_creation_page():
         source_tables = st.multiselect("Select source tables:", tables)
         
         # Show columns of selected tables
+        tables_metadata = get_tables_metadata(source_tables)
         all_columns = {}
         for table in source_tables:
-            columns = get_table_columns(table)
-            all_columns[table] = [col['column_name'] for col in columns]
+            all_columns[table] = [col['column_name'] for col in tables_metadata[table]]
             
         # Select columns for indicator
         selected_columns = {}
@@ -335,90 +1729,110 @@ def indicator_creation_page():
     # SQL query preview
     st.subheader("SQL Query Preview")
     
-    # Build the SQL query
+    # Build the query model and compile it to parameterized SQL; filter values are bound, never spliced in
     query = ""
+    compiled_query, query_params = "", []
     if source_tables and all(table in all_columns for table in source_tables):
-        # Build SELECT clause
-        select_columns = []
-        for table in source_tables:
-            for col in selected_columns.get(table, []):
-                select_columns.append(f"{table}.{col}")
-        
-        if select_columns:
-            query = "SELECT " + ", ".join(select_columns) + "\n"
-            
-            # FROM clause
-            query += f"FROM {source_tables[0]}\n"
-            
-            # Add JOINs
-            for join in joins:
-                query += f"{join['type']} {join['right_table']} ON {join['left_table']}.{join['left_column']} = {join['right_table']}.{join['right_column']}\n"
-            
-            # Add filters (WHERE)
-            if filters:
-                query += "WHERE "
-                filter_conditions = []
-                for f in filters:
-                    if f["operator"] in ["IN", "NOT IN"]:
-                        filter_conditions.append(f"{f['table']}.{f['column']} {f['operator']} ({f['value']})")
-                    elif f["operator"] == "LIKE":
-                        filter_conditions.append(f"{f['table']}.{f['column']} {f['operator']} '%{f['value']}%'")
-                    else:
-                        filter_conditions.append(f"{f['table']}.{f['column']} {f['operator']} '{f['value']}'")
-                query += " AND ".join(filter_conditions) + "\n"
-            
-            # Add ordering (ORDER BY)
-            if orders:
-                query += "ORDER BY "
-                order_conditions = []
-                for o in orders:
-                    order_conditions.append(f"{o['table']}.{o['column']} {o['direction']}")
-                query += ", ".join(order_conditions)
+        query_model = {
+            "tables": source_tables,
+            "columns": [[table, col] for table in source_tables for col in selected_columns.get(table, [])],
+            "joins": joins,
+            "filters": filters,
+            "orders": orders
+        }
+        if query_model["columns"]:
+            compiled_query, query_params = compile_query(query_model)
+            query = render_query(compiled_query, query_params)
     
     # Show query
     st.code(query)
     
-    # Button to test query
-    if query and st.button("Test Query"):
+    # Cost preview from the planner; expensive queries need confirmation before they run
+    plan = explain_query(query) if query else None
+    confirmed = True
+    if plan:
+        st.caption(f"Estimated rows: {plan['rows']:,} · estimated cost: {plan['cost']:,.0f}")
+        if plan["cost"] > QUERY_COST_CONFIRM_THRESHOLD:
+            st.warning(f"Estimated cost is above {QUERY_COST_CONFIRM_THRESHOLD:,.0f}. Check the joins and filters before running it.")
+            confirmed = st.checkbox("Run it anyway")
+    
+    # Button to test query (the result stays open while paging until the query changes)
+    if query and st.button("Test Query", disabled=not confirmed):
+        st.session_state["tested_query"] = query
+    if query and confirmed and st.session_state.get("tested_query") == query:
         try:
             with st.spinner("Executing query..."):
-                result = execute_sql(query)
                 st.write("Query Result:")
-                # Convert result to DataFrame
-                if result:
-                    df_result = pd.DataFrame(result)
-                    st.dataframe(df_result)
-                else:
+                # Capped preview; further pages are loaded on demand
+                df_result, total_rows = show_paginated_result(compiled_query, "test_query_page", page_size=PREVIEW_ROW_LIMIT, params=query_params)
+                if not total_rows:
                     st.info("Query returned no results.")
         except Exception as e:
             st.error(f"Error executing query: {str(e)}")
     
+    # Option to persist the indicator result as a table
+    materialize = st.checkbox("Materialize indicator as a table (dashboards read the stored result)")
+    
+    # Index advisor: join and filter columns that would be read with a sequential scan
+    missing_indexes = advise_indexes(joins, filters, tables_metadata) if query else []
+    create_indexes = False
+    if missing_indexes:
+        st.caption("Join/filter columns without an index: " + ", ".join(f"{t}.{c}" for t, c in missing_indexes))
+        create_indexes = st.checkbox("Create the missing indexes when saving", value=True)
+    
     # Button to save indicator
     if query and indicator_name and st.button("Save Indicator"):
         try:
-            # Prepare data to save
-            for table in source_tables:
-                for col in selected_columns.get(table, []):
-                    # For each selected column, create a record in the metadata_mappings table
-                    save_metadata_mapping(
-                        source_table=table,
-                        source_column=col,
-                        target_table="indicator_" + indicator_name.lower().replace(" ", "_"),
-                        target_column=col,
-                        transformation_rule=query,
-                        data_type="TEXT",  # Simplified, can be improved
-                        is_nullable=True
-                    )
+            target_table = "indicator_" + indicator_name.lower().replace(" ", "_")
             
-            # Log in lineage table
-            source_tables_str = ", ".join(source_tables)
-            log_data_lineage(
-                source_table=source_tables_str,
-                target_table="indicator_" + indicator_name.lower().replace(" ", "_"),
-                rows=0,  # Exact number not available here
-                layer="indicator",
-                transformation_query=query
-            )
+            # Create the advised indexes before materializing so the first build can use them
+            if create_indexes:
+                created_indexes = create_advised_indexes(missing_indexes)
+                st.info(f"Created indexes: {', '.join(created_indexes)}")
+            
+            # A saved definition replaces any stored result: rebuild it from scratch (so its row count is known),
+            # or drop it so dashboards run the new query
+            rows = 0
+            if materialize:
+                rows, _ = materialize_indicator(target_table, query, full_refresh=True)
+            else:
+                drop_indicator_table(target_table)
+            
+            # One record per selected column, carrying over each source column's declared type
+            column_data_types = {
+                (table, col["column_name"]): col["data_type"].upper()
+                for table in source_tables for col in tables_metadata[table]
+            }
+            mappings = [
+                {
+                    "source_table": table,
+                    "source_column": col,
+                    "target_table": target_table,
+                    "target_column": col,
+                    "transformation_rule": query,
+                    "data_type": column_data_types.get((table, col), "TEXT"),
+                    "is_nullable": True,
+                    "compiled_query": compiled_query,
+                    "query_params": query_params
+                }
+                for table in source_tables for col in selected_columns.get(table, [])
+            ]
+            
+            # Write the mappings and the lineage row together so a failure never leaves a partial indicator
+            save_metadata_mappings(mappings, lineage={
+                "source_table": ", ".join(source_tables),
+                "target_table": target_table,
+                "rows": rows,  # Only known when the indicator is materialized
+                "layer": "indicator",
+                "transformation_query": query
+            }, catalog={
+                "target_table": target_table,
+                "source_tables": ", ".join(source_tables),
+                "transformation_rule": query,
+                "compiled_query": compiled_query,
+                "query_params": query_params,
+                "column_count": len(mappings)
+            })
             
             st.success(f"Indicator '{indicator_name}' saved successfully!")
         except Exception as e:
@@ -427,45 +1841,62 @@ def indicator_creation_page():
 def dashboards_page():
     st.title("Dashboards")
     
-    # Get available indicators
-    mappings = get_metadata_mappings()
+    # Get available indicators from the catalog
+    indicator_names = get_indicator_names()
     
-    if not mappings:
+    if not indicator_names:
         st.warning("No indicators available. Create indicators on the 'Indicator Creation' page.")
         return
     
-    # Group by target_table (indicators)
-    indicators = {}
-    for mapping in mappings:
-        target = mapping.get('target_table', '')
-        if target.startswith('indicator_'):
-            if target not in indicators:
-                indicators[target] = []
-            indicators[target].append(mapping)
-    
     # Select indicator to view
-    indicator_names = list(indicators.keys())
     selected_indicator = st.selectbox("Select an indicator:", indicator_names)
     
     if selected_indicator:
         # Get indicator query
-        indicator_data = indicators[selected_indicator]
-        query = indicator_data[0].get('transformation_rule', '')
+        indicator_data = get_indicator_definition(selected_indicator)
+        query = indicator_data.get('transformation_rule', '')
         
         st.subheader(f"Indicator Visualization: {selected_indicator.replace('indicator_', '').replace('_', ' ').title()}")
         
-        # Execute query to get indicator data
+        # Materialized indicators are read from their table instead of recomputing the joins
+        materialized = selected_indicator in get_all_tables()
+        data_query = f"SELECT * FROM {selected_indicator}" if materialized else query
+        data_params = None
+        compiled_query = indicator_data.get('compiled_query')
+        if compiled_query and not materialized:
+            # Filter values are bound to the compiled query, so new values reuse its prepared plan
+            query_params = indicator_data.get('query_params') or []
+            if isinstance(query_params, str):
+                query_params = json.loads(query_params)
+            data_query, data_params = compiled_query, edit_query_params(compiled_query, query_params, selected_indicator)
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            # Drop the cached result so the query runs again
+            if st.button("Refresh data"):
+                invalidate_query_results(data_query, data_params)
+        with col2:
+            full_refresh = materialized and st.checkbox("Full refresh (ignore the incremental high-water mark)")
+            if materialized and st.button("Refresh materialized table"):
+                try:
+                    with st.spinner("Refreshing materialized table..."):
+                        rows, materialize_query = materialize_indicator(selected_indicator, query, full_refresh)
+                        source_tables_str = indicator_data.get('source_tables', '')
+                        log_data_lineage(source_tables_str, selected_indicator, rows, "indicator", materialize_query)
+                        st.success(f"Materialized table refreshed: {rows} rows.")
+                except Exception as e:
+                    st.error(f"Error refreshing materialized table: {str(e)}")
+        
+        # Execute query to get indicator data (chart interactions are served from the result cache)
         try:
             with st.spinner("Loading indicator data..."):
-                result = execute_sql(query)
+                # Show data in table, one page at a time
+                st.subheader("Indicator Data")
+                df_page, total_rows = show_paginated_result(data_query, "indicator_page", params=data_params)
                 
-                if result:
-                    # Convert result to DataFrame
-                    df_result = pd.DataFrame(result)
-                    
-                    # Show data in table
-                    st.subheader("Indicator Data")
-                    st.dataframe(df_result)
+                if total_rows:
+                    # Bar and Pie charts aggregate in the database; the other charts load the full result through the result cache
+                    columns = df_page.columns
                     
                     # Visualizations
                     st.subheader("Visualizations")
@@ -477,36 +1908,54 @@ def dashboards_page():
                     )
                     
                     if viz_type == "Table":
-                        st.dataframe(df_result)
+                        show_paginated_result(data_query, "table_viz_page", params=data_params)
                     
                     elif viz_type == "Bar Chart":
-                        col1, col2 = st.columns(2)
+                        col1, col2, col3 = st.columns(3)
                         with col1:
-                            x_axis = st.selectbox("X Axis:", df_result.columns)
+                            x_axis = st.selectbox("X Axis:", columns)
                         with col2:
-                            y_axis = st.selectbox("Y Axis:", df_result.columns, index=min(1, len(df_result.columns)-1))
-                        fig = px.bar(df_result, x=x_axis, y=y_axis, title=f"{selected_indicator.replace('indicator_', '').replace('_', ' ').title()}")
-                        st.plotly_chart(fig, use_container_width=True)
+                            y_axis = st.selectbox("Y Axis:", columns, index=min(1, len(columns)-1))
+                        with col3:
+                            aggregation = st.selectbox("Aggregation:", chart_aggregations(df_page[y_axis]))
+                        try:
+                            df_chart = get_aggregated_result(data_query, x_axis, y_axis, aggregation, data_params)
+                            fig = px.bar(df_chart, x=x_axis, y=y_axis, title=f"{selected_indicator.replace('indicator_', '').replace('_', ' ').title()}")
+                            st.plotly_chart(fig, use_container_width=True)
+                        except Exception as e:
+                            st.error(f"Error building chart: {str(e)}")
                     
                     elif viz_type == "Line Chart":
+                        df_result = get_indicator_result(data_query, data_params)
                         col1, col2 = st.columns(2)
                         with col1:
                             x_axis = st.selectbox("X Axis (Time):", df_result.columns)
                         with col2:
                             y_axis = st.selectbox("Y Axis (Value):", df_result.columns, index=min(1, len(df_result.columns)-1))
-                        fig = px.line(df_result, x=x_axis, y=y_axis, title=f"{selected_indicator.replace('indicator_', '').replace('_', ' ').title()}")
+                        full_resolution = st.checkbox("Full resolution")
+                        df_chart = df_result if full_resolution else downsample_series(df_result, x_axis, y_axis)
+                        if len(df_chart) < len(df_result):
+                            st.caption(f"Showing {len(df_chart)} of {len(df_result)} points (min/max per bucket)")
+                        fig = px.line(df_chart, x=x_axis, y=y_axis, title=f"{selected_indicator.replace('indicator_', '').replace('_', ' ').title()}")
                         st.plotly_chart(fig, use_container_width=True)
                     
                     elif viz_type == "Pie Chart":
-                        col1, col2 = st.columns(2)
+                        col1, col2, col3 = st.columns(3)
                         with col1:
-                            names = st.selectbox("Names:", df_result.columns)
+                            names = st.selectbox("Names:", columns)
                         with col2:
-                            values = st.selectbox("Values:", df_result.columns, index=min(1, len(df_result.columns)-1))
-                        fig = px.pie(df_result, names=names, values=values, title=f"{selected_indicator.replace('indicator_', '').replace('_', ' ').title()}")
-                        st.plotly_chart(fig, use_container_width=True)
+                            values = st.selectbox("Values:", columns, index=min(1, len(columns)-1))
+                        with col3:
+                            aggregation = st.selectbox("Aggregation:", chart_aggregations(df_page[values]))
+                        try:
+                            df_chart = get_aggregated_result(data_query, names, values, aggregation, data_params)
+                            fig = px.pie(df_chart, names=names, values=values, title=f"{selected_indicator.replace('indicator_', '').replace('_', ' ').title()}")
+                            st.plotly_chart(fig, use_container_width=True)
+                        except Exception as e:
+                            st.error(f"Error building chart: {str(e)}")
                     
                     elif viz_type == "Heatmap":
+                        df_result = get_indicator_result(data_query, data_params)
                         numeric_cols = df_result.select_dtypes(include=['number']).columns.tolist()
                         if len(numeric_cols) >= 2:
                             fig = px.imshow(
@@ -517,14 +1966,36 @@ def dashboards_page():
                         else:
                             st.warning("Not enough numeric columns to create a heatmap.")
                     
-                    # Option to export data
-                    csv = df_result.to_csv(index=False).encode('utf-8')
-                    st.download_button(
-                        "Export data as CSV",
-                        data=csv,
-                        file_name=f"{selected_indicator.replace('indicator_', '')}.csv",
-                        mime="text/csv",
-                    )
+                    # Option to export data: written page by page to a temporary file, only when asked for
+                    col1, col2 = st.columns(2)
+                    with col1:
+                        export_format = st.selectbox("Export format:", list(EXPORT_FORMATS))
+                    with col2:
+                        if st.button("Prepare export"):
+                            previous = st.session_state.pop("export_file", None)
+                            if previous and os.path.exists(previous["path"]):
+                                os.remove(previous["path"])
+                            path = export_query(
+                                data_query, export_format, data_params,
+                                progress_callback=streamlit_progress_callback("Exported rows:"),
+                                total_rows=total_rows
+                            )
+                            suffix, mime = EXPORT_FORMATS[export_format]
+                            st.session_state["export_file"] = {
+                                "indicator": selected_indicator, "path": path, "mime": mime,
+                                "file_name": f"{selected_indicator.replace('indicator_', '')}{suffix}"
+                            }
+                    remove_stale_exports()
+                    remove_stale_export_tables()
+                    export_file = st.session_state.get("export_file")
+                    if export_file and export_file["indicator"] == selected_indicator and os.path.exists(export_file["path"]):
+                        # The file is read only when the button is clicked, not on every rerun
+                        st.download_button(
+                            f"Download {export_file['file_name']}",
+                            data=lambda path=export_file["path"]: read_export_file(path),
+                            file_name=export_file["file_name"],
+                            mime=export_file["mime"],
+                        )
                 else:
                     st.info("Indicator returned no results.")
         except Exception as e:
@@ -1,13 +1,35 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import os
 from supabase import create_client, Client
+from supabase.lib.client_options import SyncClientOptions
 from dotenv import load_dotenv
 import io
+import csv
 import json
+import math
+import re
+import time
+import itertools
+import hashlib
+import uuid
+import threading
+import queue
+import atexit
+import tempfile
+import httpx
 import plotly.express as px
 import plotly.graph_objects as go
+from openpyxl import Workbook, load_workbook
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # A exportação Parquet só é oferecida quando o pyarrow está instalado
+    pa = pq = None
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FutureTimeoutError
+from collections import OrderedDict
 
 # Configuração da página
 st.set_page_config(page_title="Plataforma Metadata-Driven", layout="wide")
@@ -19,22 +41,361 @@ load_dotenv()
 SUPABASE_URL =  st.secrets["SUPABASE_URL"] #os.getenv("VITE_SUPABASE_URL")
 SUPABASE_KEY = st.secrets["SUPABASE_KEY"] #os.getenv("SUPABASE_SERVICE_ROLE_KEY")
 
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+# Pool de conexões HTTP compartilhado por todas as sessões deste processo
+SUPABASE_POOL_SIZE = int(st.secrets.get("SUPABASE_POOL_SIZE", 20))
+SUPABASE_TIMEOUT = float(st.secrets.get("SUPABASE_TIMEOUT", 60))
+SUPABASE_CONNECT_TIMEOUT = float(st.secrets.get("SUPABASE_CONNECT_TIMEOUT", 5))
+
+# Criar o cliente uma vez por processo e reutilizar as conexões keep-alive entre reruns e sessões
+@st.cache_resource
+def get_supabase_client():
+    http_client = httpx.Client(
+        limits=httpx.Limits(max_connections=SUPABASE_POOL_SIZE, max_keepalive_connections=SUPABASE_POOL_SIZE),
+        timeout=httpx.Timeout(SUPABASE_TIMEOUT, connect=SUPABASE_CONNECT_TIMEOUT),
+        follow_redirects=True
+    )
+    return create_client(SUPABASE_URL, SUPABASE_KEY, options=SyncClientOptions(httpx_client=http_client))
+
+supabase: Client = get_supabase_client()
+
+# Configurações da inserção em massa
+INSERT_BATCH_SIZE = 5000
+INSERT_MAX_WORKERS = 4
+INSERT_MAX_RETRIES = 3
+INSERT_RETRY_BACKOFF = 0.5  # Segundos, duplicado a cada nova tentativa
+# Classes de SQLSTATE que vale a pena repetir: conexão, rollback de transação, recursos e intervenção do operador
+# (o banco as devolve depois de desfazer o insert, então nada foi gravado)
+TRANSIENT_SQLSTATE_CLASSES = ("08", "40", "53", "57")
+
+# Configurações do upload em streaming
+UPLOAD_CHUNK_SIZE = 50000
+BULK_LOAD_MAX_MB = int(st.secrets.get("BULK_LOAD_MAX_MB", 50))  # Maior script de carga em massa numa só chamada; arquivos maiores usam inserts em lotes
+
+# Configurações do cache de schema
+SCHEMA_CACHE_TTL = int(st.secrets.get("SCHEMA_CACHE_TTL", 300))
+
+# Cache em memória com expiração por entrada, limite opcional de tamanho com remoção LRU e contadores de hits/misses,
+# seguro para compartilhar entre sessões
+class TTLCache:
+    def __init__(self, ttl_seconds, max_bytes=None, sizeof=None, raw_sizeof=None):
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.raw_sizeof = raw_sizeof  # Tamanho opcional de uma entrada antes da compactação, informado ao lado do tamanho real
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.total_raw_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+    
+    def _lookup(self, key, now):
+        entry = self.entries.get(key)
+        if entry and entry[0] > now:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return True, entry[1]
+        self.misses += 1
+        return False, None
+    
+    def _store(self, key, value):
+        self._remove(key)
+        size = self.sizeof(value) if self.sizeof else 0
+        raw_size = self.raw_sizeof(value) if self.raw_sizeof else size
+        self.entries[key] = (time.monotonic() + self.ttl_seconds, value, size, raw_size)
+        self.total_bytes += size
+        self.total_raw_bytes += raw_size
+        # Remover as entradas usadas há mais tempo até o cache voltar a caber no limite de tamanho
+        while self.max_bytes and self.total_bytes > self.max_bytes and len(self.entries) > 1:
+            self._remove(next(iter(self.entries)))
+            self.evictions += 1
+    
+    def _remove(self, key):
+        entry = self.entries.pop(key, None)
+        if entry:
+            self.total_bytes -= entry[2]
+            self.total_raw_bytes -= entry[3]
+    
+    def get(self, key, loader):
+        with self.lock:
+            found, value = self._lookup(key, time.monotonic())
+        if found:
+            return value
+        value = loader()
+        with self.lock:
+            self._store(key, value)
+        return value
+    
+    def get_many(self, keys, loader):
+        # O loader recebe as chaves faltantes e devolve um dict com os respectivos valores
+        found = {}
+        missing = []
+        with self.lock:
+            now = time.monotonic()
+            for key in keys:
+                hit, value = self._lookup(key, now)
+                if hit:
+                    found[key] = value
+                else:
+                    missing.append(key)
+        if missing:
+            loaded = loader(missing)
+            with self.lock:
+                for key in missing:
+                    found[key] = loaded.get(key, [])
+                    self._store(key, found[key])
+        return found
+    
+    def put(self, key, value):
+        with self.lock:
+            self._store(key, value)
+    
+    def invalidate(self, key=None):
+        with self.lock:
+            if key is None:
+                self.entries.clear()
+                self.total_bytes = 0
+                self.total_raw_bytes = 0
+            else:
+                self._remove(key)
+
+    def invalidate_matching(self, predicate):
+        with self.lock:
+            for key in [key for key in self.entries if predicate(key)]:
+                self._remove(key)
+    
+    def stats(self):
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self.entries),
+                    "bytes": self.total_bytes, "raw_bytes": self.total_raw_bytes, "evictions": self.evictions}
+
+# Cache de schema compartilhado por todas as sessões deste processo
+@st.cache_resource
+def get_schema_cache():
+    return TTLCache(SCHEMA_CACHE_TTL)
+
+# Função para descartar as entradas de schema em cache depois de DDL numa tabela
+def invalidate_schema_cache(table_name):
+    schema_cache = get_schema_cache()
+    schema_cache.invalidate(("tables",))
+    schema_cache.invalidate(("columns", table_name))
+
+# Configurações do cache de resultados
+RESULT_CACHE_TTL = int(st.secrets.get("RESULT_CACHE_TTL", 600))
+RESULT_CACHE_MAX_MB = int(st.secrets.get("RESULT_CACHE_MAX_MB", 256))
+
+# Função para medir a memória ocupada por um valor em cache (apenas DataFrames)
+def dataframe_bytes(value):
+    return int(value.memory_usage(deep=True).sum()) if isinstance(value, pd.DataFrame) else 0
+
+# Cache de resultados de indicadores compartilhado por todas as sessões deste processo, medido pela memória dos DataFrames
+@st.cache_resource
+def get_result_cache():
+    return TTLCache(
+        RESULT_CACHE_TTL,
+        max_bytes=RESULT_CACHE_MAX_MB * 1024 * 1024,
+        sizeof=dataframe_bytes,
+        raw_sizeof=lambda value: value.attrs.get("raw_bytes", dataframe_bytes(value)) if isinstance(value, pd.DataFrame) else 0
+    )
+
+# Função para construir a chave do cache de resultados de uma query
+def query_cache_key(query, params=None):
+    key_text = query + ("\n" + json.dumps(params) if params else "")
+    return ("result", hashlib.sha256(key_text.encode("utf-8")).hexdigest())
+
+# Configurações da inferência de tipos (as tabelas raw são todas TEXT, então as colunas chegam como texto)
+TYPE_INFERENCE_SAMPLE_ROWS = 1000
+CATEGORY_MAX_UNIQUE_RATIO = 0.5  # Colunas de texto com no máximo esta proporção de valores distintos viram categorias
+# Números cujo texto sobrevive à conversão; sinais, zeros à esquerda, expoentes e separadores mantêm a coluna como texto
+NUMERIC_TEXT_PATTERN = re.compile(r"^-?(0|[1-9]\d*)(\.\d+)?$")
+
+# Função para inferir o tipo de cada coluna do resultado a partir de uma amostra dos seus valores não nulos
+def infer_column_types(df, sample_rows=TYPE_INFERENCE_SAMPLE_ROWS):
+    schema = {}
+    sample_df = df.head(sample_rows)
+    for column in df.columns:
+        sample = sample_df[column].dropna()
+        if sample.empty:
+            schema[column] = "text"
+        elif pd.to_numeric(sample, errors="coerce").notna().all() and numeric_text_preserved(sample):
+            schema[column] = "numeric"
+        elif pd.to_datetime(sample.astype(str), errors="coerce", format="ISO8601", utc=True).notna().all():
+            schema[column] = "datetime"
+        elif sample.astype(str).nunique() <= len(sample) * CATEGORY_MAX_UNIQUE_RATIO and sample.map(lambda v: isinstance(v, str)).all():
+            schema[column] = "category"
+        else:
+            schema[column] = "text"
+    return schema
+
+# Função para verificar se todo valor de texto de uma coluna se lê igual depois de convertido em número
+def numeric_text_preserved(series):
+    def preserved(value):
+        if not isinstance(value, str):
+            return True
+        if not NUMERIC_TEXT_PATTERN.match(value):
+            return False
+        # O float tem de se escrever de volta como o mesmo texto: IDs longos perdem dígitos e '1.10' apareceria como 1.1
+        number = float(value)
+        return (str(int(number)) if "." not in value else repr(number)) == value
+    return series.dropna().map(preserved).all()
+
+# Função para converter uma coluna para o tipo inferido, devolvendo None quando a conversão perderia ou alteraria valores
+def convert_column(series, column_type):
+    if column_type == "numeric":
+        if not numeric_text_preserved(series):
+            return None
+        converted = pd.to_numeric(series, errors="coerce")
+    elif column_type == "datetime":
+        try:
+            converted = pd.to_datetime(series, errors="coerce", format="ISO8601")
+        except ValueError:
+            converted = pd.to_datetime(series, errors="coerce", format="ISO8601", utc=True)
+    elif column_type == "category":
+        return series.astype("category")
+    else:
+        return series
+    # Valores fora da amostra podem não caber no tipo; forçá-los a NaN/NaT os descartaria em silêncio
+    return converted if converted.notna().sum() == series.notna().sum() else None
+
+# Função para converter as colunas inteiras do resultado para os tipos inferidos; colunas que não cabem continuam texto
+def apply_column_types(df, schema):
+    applied = dict(schema)
+    for column, column_type in schema.items():
+        if column not in df.columns:
+            continue
+        converted = convert_column(df[column], column_type)
+        if converted is None:
+            applied[column] = "text"
+        else:
+            df[column] = converted
+    return df, applied
+
+# Função para reduzir um resultado tipado no próprio lugar: texto com poucos valores distintos para categorias, inteiros e
+# floats representáveis com exatidão para larguras menores, demais textos para strings baseadas em Arrow
+def compact_dataframe(df):
+    for col in df.columns:
+        series = df[col]
+        if isinstance(series.dtype, pd.CategoricalDtype) or pd.api.types.is_bool_dtype(series):
+            continue
+        if pd.api.types.is_integer_dtype(series):
+            df[col] = pd.to_numeric(series, downcast="integer")
+        elif pd.api.types.is_float_dtype(series):
+            narrowed = series.astype("float32")
+            if (narrowed.astype("float64").eq(series) | series.isna()).all():
+                df[col] = narrowed
+        elif series.dtype == object or pd.api.types.is_string_dtype(series):
+            try:
+                unique_values = series.nunique()
+            except TypeError:  # Colunas JSON guardam dicionários e listas, que ficam como estão
+                continue
+            if unique_values <= len(series) * CATEGORY_MAX_UNIQUE_RATIO:
+                df[col] = series.astype("category")
+            elif pa is not None:
+                df[col] = series.astype(pd.StringDtype("pyarrow"))
+    return df
+
+# Função para montar um DataFrame tipado do resultado, reaproveitando o schema guardado em cache para a query
+def result_dataframe(query, rows):
+    df = pd.DataFrame(rows or [])
+    if df.empty:
+        return df
+    schema_cache = get_schema_cache()
+    types_key = ("types", query_cache_key(query)[1])
+    schema = schema_cache.get(types_key, lambda: infer_column_types(df))
+    if set(schema) != set(df.columns):
+        schema = infer_column_types(df)
+        schema_cache.put(types_key, schema)
+    raw_bytes = dataframe_bytes(df)
+    df, applied = apply_column_types(df, schema)
+    if applied != schema:
+        # Uma coluna não coube no tipo em cache, então grava o schema corrigido em vez de reutilizar o antigo
+        schema_cache.put(types_key, applied)
+    df = compact_dataframe(df)
+    df.attrs["raw_bytes"] = raw_bytes
+    return df
+
+# Função para carregar o resultado de um indicador, executando a query apenas quando não está em cache
+def get_indicator_result(query, params=None):
+    return get_result_cache().get(
+        query_cache_key(query, params),
+        lambda: result_dataframe(query, fetch_query_data(query, params, timeout_seconds=None))
+    )
+
+# Função para descartar todos os resultados em cache derivados de uma query (resultado completo, contagem, páginas e tipos inferidos)
+def invalidate_query_results(query, params=None):
+    query_hash = query_cache_key(query, params)[1]
+    get_result_cache().invalidate_matching(lambda key: key[1] == query_hash)
+    get_schema_cache().invalidate(("types", query_cache_key(query)[1]))
+
+# Configurações da paginação
+PREVIEW_ROW_LIMIT = 100
+PAGE_SIZE = 500
+COUNT_ESTIMATE_CAP = 100000  # A contagem de linhas para aqui para nunca percorrer um resultado grande inteiro
+
+# Agregações executadas no banco de dados para os gráficos de barras e de pizza
+CHART_AGGREGATIONS = ["SUM", "AVG", "COUNT"]
+LINE_CHART_POINT_BUDGET = int(st.secrets.get("LINE_CHART_POINT_BUDGET", 2000))  # Pontos mantidos por linha antes da redução
+
+# Função para listar as agregações que uma coluna de valores do gráfico aceita (SUM e AVG a convertem para numeric, então só colunas numéricas as recebem)
+def chart_aggregations(series):
+    if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+        return CHART_AGGREGATIONS
+    return ["COUNT"]
 
 # Funções para interagir com o Supabase
 def get_all_tables():
-    response = supabase.rpc("get_all_tables").execute()
-    if hasattr(response, 'data') and response.data:
-        # Filtra apenas tabelas do schema 'public'
-        tables = [row['table_name'] for row in response.data if row['table_schema'] == 'public']
-        return tables
-    return []
+    def load_tables():
+        response = supabase.rpc("get_all_tables").execute()
+        if hasattr(response, 'data') and response.data:
+            # Filtra apenas tabelas do schema 'public'
+            tables = [row['table_name'] for row in response.data if row['table_schema'] == 'public']
+            return tables
+        return []
+    return get_schema_cache().get(("tables",), load_tables)
 
 def get_table_columns(table_name):
-    response = supabase.rpc("get_table_columns", {"p_table_name": table_name}).execute()
-    if hasattr(response, 'data') and response.data:
-        return response.data
-    return []
+    return get_tables_metadata([table_name])[table_name]
+
+# Metadados das colunas de várias tabelas numa só ida ao servidor; "indexes" lista os índices liderados por cada coluna
+SCHEMA_METADATA_QUERY = """
+SELECT c.table_name, c.column_name, c.data_type, c.is_nullable,
+       COALESCE((
+           SELECT json_agg(i.relname ORDER BY i.relname)
+           FROM pg_index x
+           JOIN pg_class t ON t.oid = x.indrelid
+           JOIN pg_namespace n ON n.oid = t.relnamespace
+           JOIN pg_class i ON i.oid = x.indexrelid
+           JOIN pg_attribute a ON a.attrelid = t.oid AND a.attnum = x.indkey[0]
+           WHERE n.nspname = c.table_schema AND t.relname = c.table_name AND a.attname = c.column_name
+       ), '[]') AS indexes
+FROM information_schema.columns c
+WHERE c.table_schema = 'public'{table_filter}
+ORDER BY c.table_name, c.ordinal_position
+"""
+
+# Função para obter colunas, tipos de dados e índices de uma lista de tabelas (ou de todo o schema public)
+def get_tables_metadata(table_names=None):
+    def load_metadata(keys):
+        table_filter = ""
+        if keys is not None:
+            table_filter = " AND c.table_name IN (" + ", ".join(sql_literal(key[1]) for key in keys) + ")"
+        metadata = {key: [] for key in keys or []}
+        for row in execute_sql_2(SCHEMA_METADATA_QUERY.format(table_filter=table_filter)) or []:
+            if isinstance(row.get("indexes"), str):
+                row["indexes"] = json.loads(row["indexes"])
+            metadata.setdefault(("columns", row.pop("table_name")), []).append(row)
+        return metadata
+    
+    schema_cache = get_schema_cache()
+    if table_names is None:
+        # Schema inteiro: carregar tudo num só pedido e aquecer o cache de cada tabela
+        metadata = load_metadata(None)
+        for key, columns in metadata.items():
+            schema_cache.put(key, columns)
+        return {key[1]: columns for key, columns in metadata.items()}
+    metadata = schema_cache.get_many([("columns", table) for table in table_names], load_metadata)
+    return {key[1]: columns for key, columns in metadata.items()}
 
 def execute_sql(query):
     response = supabase.rpc("execute_sql", {"query": query}).execute()
@@ -44,6 +405,90 @@ def execute_sql_2(query):
     response = supabase.rpc("execute_sql_2", {"query": query}).execute()
     return response.data
 
+# Configurações do gravador de linhagem
+LINEAGE_FLUSH_INTERVAL = float(st.secrets.get("LINEAGE_FLUSH_INTERVAL", 2.0))  # Segundos que um evento pode esperar até o seu lote ser gravado
+LINEAGE_BATCH_SIZE = 100
+LINEAGE_CLOSE_TIMEOUT = float(st.secrets.get("LINEAGE_CLOSE_TIMEOUT", 30.0))  # Segundos que close espera pela gravação final da thread do gravador
+LINEAGE_MAX_FLUSH_ATTEMPTS = 3  # Tentativas de gravação de um evento com falha antes de ser descartado
+
+# Gravador em segundo plano que acumula eventos de linhagem e os insere em lotes, fora do caminho das requisições
+class LineageWriter:
+    def __init__(self, flush_interval=LINEAGE_FLUSH_INTERVAL, batch_size=LINEAGE_BATCH_SIZE):
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.events = queue.Queue()
+        self.written = 0
+        self.failed = 0
+        self.last_error = None
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="lineage-writer", daemon=True)
+        self.thread.start()
+
+    def _next_batch(self):
+        # Wait for a first event, then keep collecting until the batch is full or the interval has passed
+        try:
+            batch = [self.events.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self.events.get(timeout=max(0, deadline - time.monotonic())))
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch):
+        status = insert_batch_with_retry("data_lineage", [event for _, event in batch])
+        if status["status"] == "ok":
+            self.written += len(batch)
+        else:
+            self.last_error = status["error"]
+            for attempts, event in batch:
+                if attempts + 1 < LINEAGE_MAX_FLUSH_ATTEMPTS:
+                    self.events.put((attempts + 1, event))
+                else:
+                    self.failed += 1
+        for _ in batch:
+            self.events.task_done()
+
+    def _run(self):
+        while not self.stopped.is_set():
+            batch = self._next_batch()
+            if batch:
+                self._write(batch)
+        # Gravação final depois de close: só esta thread grava, e cada evento restante tem uma última tentativa
+        while True:
+            batch = []
+            while len(batch) < self.batch_size and not self.events.empty():
+                batch.append(self.events.get_nowait())
+            if not batch:
+                return
+            self._write([(LINEAGE_MAX_FLUSH_ATTEMPTS, event) for _, event in batch])
+
+    def write(self, event):
+        self.events.put((0, event))
+
+    def flush(self):
+        # Block until every queued event has been written or given up on
+        self.events.join()
+
+    def close(self, timeout=LINEAGE_CLOSE_TIMEOUT):
+        # Sinaliza a thread e espera que ela termine o lote atual e a gravação final
+        self.stopped.set()
+        self.thread.join(timeout=timeout)
+
+    def stats(self):
+        return {"pending": self.events.qsize(), "written": self.written, "failed": self.failed,
+                "last_error": self.last_error}
+
+# Gravador de linhagem compartilhado por todas as sessões deste processo, esvaziado quando o processo termina
+@st.cache_resource
+def get_lineage_writer():
+    writer = LineageWriter()
+    atexit.register(writer.close)
+    return writer
+
 def log_data_lineage(source_table, target_table, rows, layer, transformation_query):
     data = {
         "source_table": source_table,
@@ -52,38 +497,123 @@ def log_data_lineage(source_table, target_table, rows, layer, transformation_que
         "layer": layer,
         "transformation_query": transformation_query
     }
-    response = supabase.table("data_lineage").insert(data).execute()
-    return response.data
+    get_lineage_writer().write(data)
+    return data
 
-def save_metadata_mapping(source_table, source_column, target_table, target_column, 
-                          transformation_rule, data_type, is_nullable):
-    data = {
-        "source_table": source_table,
-        "source_column": source_column,
-        "target_table": target_table,
-        "target_column": target_column,
-        "transformation_rule": transformation_rule,
-        "data_type": data_type,
-        "is_nullable": is_nullable
-    }
-    response = supabase.table("metadata_mappings").insert(data).execute()
-    return response.data
+# Função para representar um valor Python como literal SQL para as tabelas de metadados
+def sql_value(value):
+    if isinstance(value, bool):
+        return "TRUE" if value else "FALSE"
+    if isinstance(value, (int, float)):
+        return str(value)
+    if isinstance(value, (list, dict)):
+        return sql_literal(json.dumps(value)) + "::jsonb"
+    return sql_literal(value)
 
-def get_metadata_mappings():
-    response = supabase.table("metadata_mappings").select("*").execute()
-    if hasattr(response, 'data') and response.data:
-        return response.data
-    return []
+# Função para gravar vários mapeamentos de metadados, e opcionalmente a sua linha de linhagem, num único script e numa só transação
+def save_metadata_mappings(mappings, lineage=None, catalog=None):
+    statements = []
+    if catalog:
+        columns = list(catalog)
+        updates = ", ".join(f"{column} = EXCLUDED.{column}" for column in columns if column != "target_table")
+        statements.append(
+            f"INSERT INTO meta_indicator_catalog ({', '.join(columns)}) VALUES "
+            f"({', '.join(sql_value(catalog[column]) for column in columns)})\n"
+            f"ON CONFLICT (target_table) DO UPDATE SET {updates}, updated_at = current_timestamp;"
+        )
+    for table_name, rows in (("metadata_mappings", mappings), ("data_lineage", [lineage] if lineage else [])):
+        if not rows:
+            continue
+        columns = list(dict.fromkeys(column for row in rows for column in row))
+        values = ",\n".join("(" + ", ".join(sql_value(row.get(column)) for column in columns) + ")" for row in rows)
+        statements.append(f"INSERT INTO {table_name} ({', '.join(columns)}) VALUES\n{values};")
+    if statements:
+        execute_sql("\n".join(statements))
+    if catalog:
+        invalidate_indicator_catalog(catalog["target_table"])
 
-# Função para criar nova tabela raw
-def create_raw_table(table_name, df):
-    # Renomear colunas conforme regras
+# O catálogo de indicadores (meta_indicator_catalog, uma linha por indicador com a sua SQL, para que os dashboards nunca
+# varram metadata_mappings) vem em supabase/migrations/20261016120200_indicator_catalog.sql
+
+# Função para listar os nomes dos indicadores a partir do catálogo
+def get_indicator_names():
+    def load_names():
+        rows = execute_sql_2("SELECT target_table FROM meta_indicator_catalog ORDER BY target_table") or []
+        return [row["target_table"] for row in rows]
+    return get_schema_cache().get(("indicators",), load_names)
+
+# Função para buscar a definição de um indicador pela chave primária
+def get_indicator_definition(target_table):
+    def load_definition():
+        rows = execute_sql_2(
+            "SELECT target_table, source_tables, transformation_rule, compiled_query, query_params "
+            f"FROM meta_indicator_catalog WHERE target_table = {sql_literal(target_table)}"
+        ) or []
+        return rows[0] if rows else {}
+    return get_schema_cache().get(("indicator", target_table), load_definition)
+
+# Função para descartar as entradas do catálogo em cache depois de salvar um indicador
+def invalidate_indicator_catalog(target_table):
+    schema_cache = get_schema_cache()
+    schema_cache.invalidate(("indicators",))
+    schema_cache.invalidate(("indicator", target_table))
+
+# Função para aplicar as regras de nomes de colunas a um DataFrame carregado
+def normalize_columns(df):
     df.columns = [col.replace(' ', '_').replace('-', '_').replace('.', '_') for col in df.columns]
+    return df
+
+# Função para representar um valor Python como literal de texto SQL
+def sql_literal(value):
+    if value is None:
+        return "NULL"
+    return "'" + str(value).replace("'", "''") + "'"
+
+# Função para representar cada linha de um DataFrame como tupla SQL VALUES, com uma passagem vetorizada por coluna
+def dataframe_to_sql_values(df):
+    literals = [
+        ("'" + df[col].astype(str).str.replace("'", "''", regex=False) + "'").where(df[col].notna(), "NULL")
+        for col in df.columns
+    ]
+    rows = literals[0]
+    for literal in literals[1:]:
+        rows = rows + ", " + literal
+    return "(" + rows + ")"
+
+# Tipos de coluna que a criação de tabelas pode propor para os dados enviados
+COLUMN_TYPES = ["TEXT", "INTEGER", "NUMERIC", "DATE", "TIMESTAMPTZ", "BOOLEAN"]
+INTEGER_MAX = 2**31 - 1
+
+# Função para propor um tipo para cada coluna enviada a partir dos seus valores em texto, uma passada vetorizada por coluna
+def profile_column_types(df):
+    column_types = {}
+    for col in df.columns:
+        values = df[col].dropna().astype(str).str.strip()
+        values = values[values != ""]
+        numbers = pd.to_numeric(values, errors="coerce")
+        if values.empty or values.str.match(r"^[+-]?0\d").any():  # Códigos com zeros à esquerda continuam TEXT para não perder esses zeros
+            column_types[col] = "TEXT"
+        elif values.str.lower().isin(["true", "false", "t", "f"]).all():
+            column_types[col] = "BOOLEAN"
+        elif values.str.fullmatch(r"[+-]?\d+").all() and numbers.abs().max() <= INTEGER_MAX:
+            column_types[col] = "INTEGER"
+        elif numbers.notna().all():
+            column_types[col] = "NUMERIC"
+        elif pd.to_datetime(values, errors="coerce", format="ISO8601", utc=True).notna().all():
+            column_types[col] = "DATE" if values.str.fullmatch(r"\d{4}-\d{2}-\d{2}").all() else "TIMESTAMPTZ"
+        else:
+            column_types[col] = "TEXT"
+    return column_types
+
+# Função para construir o script CREATE TABLE de um DataFrame carregado
+def build_create_table_query(table_name, df, column_types=None):
+    # Renomear colunas conforme regras
+    normalize_columns(df)
     
     # Criar script SQL para criação da tabela
     columns = []
     for col in df.columns:
-        columns.append(f"{col.upper()} TEXT")
+        columns.append(f"{col.upper()} {(column_types or {}).get(col, 'TEXT')}")
     
     # Adicionar colunas de controle e ID
     columns.insert(0, "ID SERIAL PRIMARY KEY")
@@ -95,35 +625,826 @@ def create_raw_table(table_name, df):
     # Criar query SQL
     create_table_query = f"CREATE TABLE {table_name} (\n\t" + ",\n\t".join(columns) + "\n);"
     
+    return create_table_query
+
+# Função para registrar o tipo declarado de cada coluna da tabela raw em metadata_mappings, junto com a linha de linhagem
+def record_column_types(table_name, columns, column_types, create_table_query, rows):
+    save_metadata_mappings(
+        [
+            {
+                "source_table": "upload",
+                "source_column": col,
+                "target_table": table_name,
+                "target_column": col.lower(),
+                "transformation_rule": create_table_query,
+                "data_type": (column_types or {}).get(col, "TEXT"),
+                "is_nullable": True
+            }
+            for col in columns
+        ],
+        lineage={"source_table": "upload", "target_table": table_name, "rows": rows, "layer": "raw",
+                 "transformation_query": create_table_query}
+    )
+
+# Função para criar nova tabela raw
+def create_raw_table(table_name, df, column_types=None):
+    create_table_query = build_create_table_query(table_name, df, column_types)
+    
     # Executar query
     result = execute_sql(create_table_query)
+    invalidate_schema_cache(table_name)
     
     # Registrar na tabela de linhagem
-    log_data_lineage("upload", table_name, len(df), "raw", create_table_query)
+    record_column_types(table_name, df.columns, column_types, create_table_query, len(df))
     
     return result
 
-# Função para inserir dados na tabela
-def insert_data_to_table(table_name, df):
-    # Renomear colunas conforme regras
-    df.columns = [col.replace(' ', '_').replace('-', '_').replace('.', '_') for col in df.columns]
+# Função para criar uma tabela raw e carregar todos os blocos junto com ela numa única chamada ao servidor
+def create_raw_table_with_data(table_name, chunks, column_types=None):
+    started_at = time.perf_counter()
+    chunks = iter(chunks)
+    first_chunk = next(chunks)
+    create_table_query = build_create_table_query(table_name, first_chunk, column_types)
+    columns = ", ".join(col.upper() for col in first_chunk.columns)
     
-    # Preparar dados para inserção
-    records = []
-    for _, row in df.iterrows():
-        record = {}
-        for col in df.columns:
-            record[col.upper()] = str(row[col]) if pd.notna(row[col]) else None
-        records.append(record)
+    # Preparar todas as linhas como um único payload VALUES compacto com várias linhas
+    script = io.StringIO()
+    script.write(create_table_query + "\n")
+    rows = 0
+    for chunk in itertools.chain([first_chunk], chunks):
+        normalize_columns(chunk)
+        if chunk.empty:
+            continue
+        script.write(f"INSERT INTO {table_name} ({columns}) VALUES\n" if not rows else ",\n")
+        script.write(",\n".join(dataframe_to_sql_values(chunk)))
+        rows += len(chunk)
+        if script.tell() > BULK_LOAD_MAX_MB * 1024 * 1024:
+            # Para antes de o script estourar a memória e o limite de tamanho do pedido; nada foi enviado ainda
+            raise ValueError(f"A carga em massa está limitada a {BULK_LOAD_MAX_MB} MB; use o insert em lotes para este arquivo")
+    script.write(";" if rows else "")
     
-    # Inserir dados
-    response = supabase.table(table_name).insert(records).execute()
+    # A RPC executa o script inteiro numa só transação, por isso uma falha não deixa a tabela criada
+    execute_sql(script.getvalue())
+    invalidate_schema_cache(table_name)
+    elapsed = time.perf_counter() - started_at
     
     # Registrar na tabela de linhagem
+    record_column_types(table_name, first_chunk.columns, column_types, create_table_query, rows)
+    summary = {
+        "rows_ok": rows,
+        "rows_failed": 0,
+        "elapsed_seconds": round(elapsed, 3),
+        "rows_per_second": round(rows / elapsed, 1) if elapsed else None,
+        "batches": [{"batch": 1, "rows": rows, "status": "ok", "attempts": 1, "seconds": round(elapsed, 3),
+                     "rows_per_second": round(rows / elapsed, 1) if elapsed else None}]
+    }
     insert_query = f"INSERT INTO {table_name} (...) VALUES (...)"  # Simplificado para o registro
-    log_data_lineage("upload", table_name, len(records), "raw", insert_query)
+    log_data_lineage("upload", table_name, rows, "raw", insert_query + "\n-- carga em massa: " + json.dumps(summary))
     
-    return response.data
+    summary["failed_records"] = []
+    return summary
+
+# Função para converter um DataFrame em registros de inserção num único passo vetorizado
+def dataframe_to_records(df):
+    # Enviar todos os valores como texto e manter os valores em falta como NULL
+    values = df.astype(str).astype(object).where(df.notna(), None)
+    return values.to_dict(orient="records")
+
+# Função para decidir se vale a pena repetir um pedido que falhou
+def is_transient_error(error):
+    # Inserts não são idempotentes (as tabelas raw só têm uma chave SERIAL), então só são repetidas falhas ocorridas antes
+    # de o pedido chegar ao banco; um read timeout ou um 5xx pode vir depois de o lote ter sido gravado
+    if isinstance(error, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)):
+        return True
+    code = str(getattr(error, "code", "") or "")
+    if code.isdigit() and len(code) == 3:
+        # Status HTTP devolvido pelo gateway sem encaminhar o pedido
+        return code in ("429", "503")
+    return code.startswith(TRANSIENT_SQLSTATE_CLASSES)
+
+# Função para inserir um lote, repetindo falhas transitórias com backoff exponencial
+def insert_batch_with_retry(table_name, batch, max_retries=INSERT_MAX_RETRIES):
+    started_at = time.perf_counter()
+    status = {"rows": len(batch), "status": "ok", "attempts": 0}
+    while True:
+        status["attempts"] += 1
+        try:
+            supabase.table(table_name).insert(batch).execute()
+            break
+        except Exception as e:
+            if status["attempts"] > max_retries or not is_transient_error(e):
+                status["status"] = "failed"
+                status["error"] = str(e)
+                break
+            time.sleep(INSERT_RETRY_BACKOFF * 2 ** (status["attempts"] - 1))
+    
+    elapsed = time.perf_counter() - started_at
+    status["seconds"] = round(elapsed, 3)
+    status["rows_per_second"] = round(len(batch) / elapsed, 1) if elapsed else None
+    return status
+
+# Função para enviar os lotes de inserção através de um pool de threads limitado
+def upload_batches(table_name, records, batch_size=INSERT_BATCH_SIZE, max_workers=INSERT_MAX_WORKERS,
+                   progress_callback=None):
+    batches = [records[start:start + batch_size] for start in range(0, len(records), batch_size)]
+    batch_stats = []
+    failed_records = []
+    rows_done = 0
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(insert_batch_with_retry, table_name, batch): number
+            for number, batch in enumerate(batches, start=1)
+        }
+        for future in as_completed(futures):
+            status = {"batch": futures[future], **future.result()}
+            batch_stats.append(status)
+            if status["status"] == "failed":
+                failed_records.extend(batches[status["batch"] - 1])
+            rows_done += status["rows"]
+            if progress_callback:
+                progress_callback(rows_done, len(records))
+    
+    return sorted(batch_stats, key=lambda status: status["batch"]), failed_records
+
+# Função para resumir um upload e registrá-lo na tabela de linhagem
+def log_upload_summary(table_name, batch_stats, failed_records, elapsed):
+    rows_ok = sum(status["rows"] for status in batch_stats if status["status"] == "ok")
+    summary = {
+        "rows_ok": rows_ok,
+        "rows_failed": len(failed_records),
+        "elapsed_seconds": round(elapsed, 3),
+        "rows_per_second": round(rows_ok / elapsed, 1) if elapsed else None,
+        "batches": batch_stats
+    }
+    
+    # Registrar na tabela de linhagem
+    insert_query = f"INSERT INTO {table_name} (...) VALUES (...)"  # Simplificado para o registro
+    log_data_lineage("upload", table_name, rows_ok, "raw", insert_query + "\n-- resumo: " + json.dumps(summary))
+    
+    # Guardar as linhas que falharam para reenviar apenas esses lotes
+    summary["failed_records"] = failed_records
+    return summary
+
+# Função para inserir registros já preparados numa tabela
+def insert_records_to_table(table_name, records, batch_size=INSERT_BATCH_SIZE, max_workers=INSERT_MAX_WORKERS,
+                            progress_callback=None):
+    started_at = time.perf_counter()
+    batch_stats, failed_records = upload_batches(table_name, records, batch_size, max_workers, progress_callback)
+    return log_upload_summary(table_name, batch_stats, failed_records, time.perf_counter() - started_at)
+
+# Função para inserir um fluxo de blocos de DataFrame, mantendo apenas um bloco em memória de cada vez
+def insert_chunks_to_table(table_name, chunks, batch_size=INSERT_BATCH_SIZE, max_workers=INSERT_MAX_WORKERS,
+                           progress_callback=None, total_rows=None):
+    started_at = time.perf_counter()
+    batch_stats = []
+    failed_records = []
+    rows_done = 0
+    for chunk in chunks:
+        records = dataframe_to_records(normalize_columns(chunk).rename(columns=str.upper))
+        chunk_progress = None
+        if progress_callback:
+            chunk_progress = lambda done, total, offset=rows_done: progress_callback(offset + done, total_rows)
+        chunk_stats, chunk_failed = upload_batches(table_name, records, batch_size, max_workers, chunk_progress)
+        for status in chunk_stats:
+            batch_stats.append({**status, "batch": len(batch_stats) + 1})
+        failed_records.extend(chunk_failed)
+        rows_done += len(records)
+    
+    return log_upload_summary(table_name, batch_stats, failed_records, time.perf_counter() - started_at)
+
+# Função para listar as abas de uma planilha carregada sem ler as células
+def get_excel_sheet_names(uploaded_file):
+    uploaded_file.seek(0)
+    workbook = load_workbook(uploaded_file, read_only=True)
+    try:
+        return workbook.sheetnames
+    finally:
+        workbook.close()
+
+# Função para representar uma célula da planilha como texto, escrevendo números inteiros sem .0 no final
+def cell_text(value):
+    if value is None:
+        return None
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+# Função para nomear as colunas da aba como o pd.read_excel faz: 'Unnamed: n' para cabeçalhos vazios e sufixos .1, .2
+# para os repetidos
+def excel_column_names(header, width):
+    header = tuple(header) + (None,) * (width - len(header))
+    names = [str(value) if value is not None else f"Unnamed: {i}" for i, value in enumerate(header)]
+    taken = set(names)
+    counts = {}
+    # As colunas com nome são numeradas primeiro e um sufixo nunca reutiliza um nome já presente no cabeçalho, como no pandas
+    for i in [i for i, value in enumerate(header) if value is not None] + [i for i, value in enumerate(header) if value is None]:
+        base = name = names[i]
+        count = counts.get(base, 0)
+        while count:
+            counts[base] = count + 1
+            name = f"{base}.{count}"
+            count = count + 1 if name in taken else counts.get(name, 0)
+        names[i] = name
+        taken.add(name)
+        counts[name] = count + 1
+    return names
+
+# Função para obter o número da última célula preenchida de uma linha da aba
+def filled_width(row):
+    return max((i + 1 for i, value in enumerate(row) if value is not None), default=0)
+
+# Função para ler uma aba linha a linha em modo somente leitura, devolvendo blocos de DataFrame
+def read_excel_chunks(uploaded_file, sheet_name=None, chunksize=None):
+    uploaded_file.seek(0)
+    workbook = load_workbook(uploaded_file, read_only=True, data_only=True)
+    try:
+        worksheet = workbook[sheet_name] if sheet_name else workbook.active
+        rows = worksheet.iter_rows(values_only=True)
+        header = next(rows, ())
+        header = header[:filled_width(header)]
+        width = len(header)
+        if worksheet.max_column is None or worksheet.max_column > width:
+            # Pode haver células à direita do cabeçalho; encontra primeiro a linha mais larga para nenhuma ser descartada
+            width = max([width] + [filled_width(row) for row in worksheet.iter_rows(min_row=2, values_only=True)])
+            rows = worksheet.iter_rows(min_row=2, values_only=True)
+        columns = excel_column_names(header, width)
+        chunk = []
+        chunks_read = 0
+        for row in rows:
+            # Ignorar linhas totalmente vazias e completar linhas curtas até a largura da aba
+            if all(value is None for value in row):
+                continue
+            chunk.append(tuple(cell_text(value) for value in row[:width]) + (None,) * (width - len(row)))
+            if chunksize and len(chunk) >= chunksize:
+                yield pd.DataFrame(chunk, columns=columns)
+                chunks_read += 1
+                chunk = []
+        if chunk or not chunks_read:
+            yield pd.DataFrame(chunk, columns=columns)
+    finally:
+        workbook.close()
+
+# Função para ler um arquivo carregado como um fluxo de blocos de DataFrame em texto (um único bloco quando chunksize é None);
+# o pandas inferiria os tipos por bloco, e um bloco posterior poderia enviar 3 como '3.0'
+def read_upload_chunks(uploaded_file, chunksize=None, sheet_name=None):
+    uploaded_file.seek(0)
+    if uploaded_file.name.endswith('.csv'):
+        if chunksize:
+            yield from pd.read_csv(uploaded_file, chunksize=chunksize, dtype=str)
+        else:
+            yield pd.read_csv(uploaded_file, dtype=str)
+    else:
+        yield from read_excel_chunks(uploaded_file, sheet_name, chunksize)
+
+# Função para abrir um upload como fluxo de blocos, pedindo a aba quando é uma planilha Excel
+def open_upload(uploaded_file, chunksize=None):
+    sheet_name = None
+    if not uploaded_file.name.endswith('.csv'):
+        sheet_name = st.selectbox("Aba:", get_excel_sheet_names(uploaded_file))
+    return read_upload_chunks(uploaded_file, chunksize, sheet_name)
+
+# Função para mostrar o progresso da inserção na interface
+def streamlit_progress_callback(label, uploaded_file=None):
+    progress_bar = st.progress(0.0, text=label)
+    
+    def update(done, total):
+        if total is None and uploaded_file is not None:
+            # O total de linhas é desconhecido em streaming, por isso acompanha-se a posição de leitura no arquivo
+            progress_bar.progress(min(uploaded_file.tell() / max(uploaded_file.size, 1), 1.0), text=f"{label} {done}")
+        else:
+            progress_bar.progress(min(done / total, 1.0) if total else 1.0, text=f"{label} {done}/{total}")
+    
+    return update
+
+# Função para mostrar o resumo do upload e guardar as linhas que ainda faltam inserir
+def show_upload_summary(table_name, summary):
+    if summary["rows_failed"]:
+        st.session_state["failed_upload"] = {"table": table_name, "records": summary["failed_records"]}
+        st.warning(f"{summary['rows_ok']} registros inseridos, {summary['rows_failed']} registros falharam. "
+                   "Use 'Repetir lotes com falha' para reenviar apenas as linhas que falharam.")
+    else:
+        st.session_state.pop("failed_upload", None)
+    st.caption(f"{summary['rows_ok']} linhas em {summary['elapsed_seconds']}s ({summary['rows_per_second']} linhas/s)")
+    st.dataframe(pd.DataFrame(summary["batches"]))
+    return not summary["rows_failed"]
+
+# Função para contar as linhas de uma tabela
+def count_table_rows(table_name):
+    result = execute_sql_2(f"SELECT COUNT(*) AS row_count FROM {table_name}")
+    return int(result[0]["row_count"]) if result else 0
+
+# Coluna de auditoria preenchida por create_raw_table, usada como marca d'água da atualização incremental
+AUDIT_CREATED_COLUMN = "DT_CRTD"
+
+# Carimbo de auditoria mais recente que é seguro usar como marca. CREATED_AT é o início da transação que insere, então um
+# lote ainda em curso pode gravar linhas mais antigas que MAX(CREATED_AT); a marca fica logo antes da transação aberta mais antiga
+HIGH_WATER_MARK_QUERY = """
+SELECT LEAST(
+	MAX({column}),
+	(SELECT MIN(xact_start) - interval '1 microsecond' FROM pg_stat_activity
+	 WHERE backend_type = 'client backend' AND state <> 'idle' AND pid <> pg_backend_pid())
+) AS high_water_mark
+FROM {table}
+"""
+
+# A tabela de estado de atualização (meta_indicator_refresh_state, a marca d'água de cada indicador atualizado de forma
+# incremental) vem em supabase/migrations/20261016120300_indicator_refresh_state.sql
+
+# Função para encontrar a tabela fonte de um indicador que pode ser atualizado acrescentando novas linhas
+def get_incremental_source_table(query):
+    # Apenas indicadores de uma só tabela e sem agregação se qualificam, e a fonte precisa da coluna de auditoria
+    match = re.search(r"^FROM (\w+)$", query, re.M)
+    if not match or re.search(r"\b(JOIN|GROUP BY|DISTINCT)\b", query, re.I):
+        return None
+    source_table = match.group(1)
+    columns = [col['column_name'].lower() for col in get_table_columns(source_table)]
+    return source_table if AUDIT_CREATED_COLUMN.lower() in columns else None
+
+# Função para restringir a tabela fonte do indicador a uma janela da coluna de auditoria
+def bound_source_table(query, source_table, low_mark, high_mark):
+    conditions = [f"({AUDIT_CREATED_COLUMN} IS NULL OR {AUDIT_CREATED_COLUMN} <= {sql_literal(high_mark)})"]
+    if low_mark is not None:
+        conditions = [f"{AUDIT_CREATED_COLUMN} > {sql_literal(low_mark)}", f"{AUDIT_CREATED_COLUMN} <= {sql_literal(high_mark)}"]
+    bounded = f"(SELECT * FROM {source_table} WHERE {' AND '.join(conditions)}) AS {source_table}"
+    return query.replace(f"FROM {source_table}\n", f"FROM {bounded}\n", 1)
+
+# Função para materializar um indicador na sua tabela indicador_*, acrescentando apenas as novas linhas da fonte quando possível
+def materialize_indicator(target_table, query, full_refresh=False):
+    exists = target_table in get_all_tables()
+    source_table = get_incremental_source_table(query)
+    high_mark = None
+    low_mark = None
+    if source_table:
+        high_mark = execute_sql_2(HIGH_WATER_MARK_QUERY.format(column=AUDIT_CREATED_COLUMN, table=source_table))[0]["high_water_mark"]
+        if exists and not full_refresh:
+            state = execute_sql_2(
+                "SELECT high_water_mark FROM meta_indicator_refresh_state "
+                f"WHERE target_table = {sql_literal(target_table)} AND source_table = {sql_literal(source_table)}"
+            )
+            low_mark = state[0]["high_water_mark"] if state else None
+    
+    if high_mark is None or low_mark is None:
+        # Sem marca d'água utilizável: reconstruir a tabela inteira, apagando-a antes para que um conjunto de colunas
+        # alterado ainda caiba, e esquecer as marcas de qualquer definição anterior
+        rebuild_query = bound_source_table(query, source_table, None, high_mark) if high_mark is not None else query
+        materialize_query = (
+            f"DROP TABLE IF EXISTS {target_table};\nCREATE TABLE {target_table} AS\n{rebuild_query};\n"
+            f"DELETE FROM meta_indicator_refresh_state WHERE target_table = {sql_literal(target_table)};"
+        )
+    elif high_mark == low_mark:
+        # Nada foi criado na tabela fonte desde a última atualização
+        return count_table_rows(target_table), "-- nenhuma linha nova desde " + str(low_mark)
+    else:
+        # Acrescentar apenas as linhas criadas desde a última atualização
+        materialize_query = f"INSERT INTO {target_table}\n{bound_source_table(query, source_table, low_mark, high_mark)};"
+    
+    if high_mark is not None:
+        materialize_query += (
+            "\nINSERT INTO meta_indicator_refresh_state (target_table, source_table, high_water_mark) "
+            f"VALUES ({sql_literal(target_table)}, {sql_literal(source_table)}, {sql_literal(high_mark)}) "
+            "ON CONFLICT (target_table, source_table) DO UPDATE "
+            "SET high_water_mark = GREATEST(meta_indicator_refresh_state.high_water_mark, EXCLUDED.high_water_mark), "
+            "refreshed_at = current_timestamp;"
+        )
+    execute_sql(materialize_query)
+    invalidate_schema_cache(target_table)
+    invalidate_query_results(f"SELECT * FROM {target_table}")
+    return count_table_rows(target_table), materialize_query
+
+# Função para apagar a tabela guardada e o estado de atualização de um indicador, para os dashboards voltarem a executar a sua query
+def drop_indicator_table(target_table):
+    execute_sql(
+        f"DROP TABLE IF EXISTS {target_table};\n"
+        f"DELETE FROM meta_indicator_refresh_state WHERE target_table = {sql_literal(target_table)};"
+    )
+    invalidate_schema_cache(target_table)
+    invalidate_query_results(f"SELECT * FROM {target_table}")
+
+# Função para listar as colunas de join e de filtro que não iniciam nenhum índice existente
+def advise_indexes(joins, filters, tables_metadata):
+    indexed = {
+        (table, col["column_name"])
+        for table, columns in tables_metadata.items() for col in columns if col.get("indexes")
+    }
+    keys = [(join["left_table"], join["left_column"]) for join in joins]
+    keys += [(join["right_table"], join["right_column"]) for join in joins]
+    # LIKE '%...%' não aproveita um índice B-tree, então esses filtros são ignorados
+    keys += [(f["table"], f["column"]) for f in filters if f["operator"] != "LIKE"]
+    return [key for key in dict.fromkeys(keys) if key not in indexed and key[0] in tables_metadata]
+
+# Função para criar os índices B-tree sugeridos, registrando cada um na tabela de linhagem
+def create_advised_indexes(index_keys):
+    created = []
+    for table_name, column in index_keys:
+        # O hash mantém os nomes distintos quando são cortados em 63 caracteres ou quando idx_a_b_c pode ser a_b.c ou a.b_c
+        name_hash = hashlib.md5(f"{table_name}.{column}".encode("utf-8")).hexdigest()[:8]
+        index_name = f"idx_{table_name}_{column}"[:54] + "_" + name_hash
+        index_query = f"CREATE INDEX IF NOT EXISTS {index_name} ON {table_name} USING btree ({column});"
+        execute_sql(index_query)
+        invalidate_schema_cache(table_name)
+        log_data_lineage(table_name, table_name, 0, "index", index_query)
+        created.append(index_name)
+    return created
+
+# As colunas compiled_query e query_params de metadata_mappings vêm em
+# supabase/migrations/20261016120100_query_model_columns.sql
+
+# Função para separar um valor de IN / NOT IN em itens; os itens podem vir entre aspas ('a, b', 'O''Brien') para conter vírgulas ou aspas
+def parse_list_value(text):
+    return [v.strip() for v in next(csv.reader([str(text)], quotechar="'", skipinitialspace=True), []) if v.strip()]
+
+# Função para escrever os itens de volta como um valor de IN / NOT IN que parse_list_value lê do mesmo jeito
+def format_list_value(values):
+    return ", ".join("'" + str(v).replace("'", "''") + "'" if re.search(r"[,']", str(v)) else str(v) for v in values)
+
+# Função para compilar o modelo de query do indicador (tabelas, colunas, joins, filtros, ordenação) em SQL com parâmetros $n
+def compile_query(model):
+    params = []
+
+    def bind(value):
+        params.append(value)
+        return f"${len(params)}"
+
+    # Um nome de coluna já presente na saída recebe o nome da tabela (t2.id AS t2_id), para o CREATE TABLE AS aceitá-lo
+    output_columns, select_list = set(), []
+    for table, col in model["columns"]:
+        name = col
+        if name in output_columns:
+            name = f"{table}_{col}"
+            for n in itertools.count(2):
+                if name not in output_columns:
+                    break
+                name = f"{table}_{col}_{n}"
+        output_columns.add(name)
+        select_list.append(f"{table}.{col}" if name == col else f"{table}.{col} AS {name}")
+    query = "SELECT " + ", ".join(select_list) + "\n"
+    query += f"FROM {model['tables'][0]}\n"
+    for join in model["joins"]:
+        query += f"{join['type']} {join['right_table']} ON {join['left_table']}.{join['left_column']} = {join['right_table']}.{join['right_column']}\n"
+    if model["filters"]:
+        filter_conditions = []
+        for f in model["filters"]:
+            column = f"{f['table']}.{f['column']}"
+            if f["operator"] in ["IN", "NOT IN"]:
+                values = parse_list_value(f["value"])
+                comparison = "= ANY" if f["operator"] == "IN" else "<> ALL"
+                filter_conditions.append(f"{column} {comparison}({bind(values)})")
+            elif f["operator"] == "LIKE":
+                filter_conditions.append(f"{column} LIKE {bind('%' + f['value'] + '%')}")
+            else:
+                filter_conditions.append(f"{column} {f['operator']} {bind(f['value'])}")
+        query += "WHERE " + " AND ".join(filter_conditions) + "\n"
+    if model["orders"]:
+        query += "ORDER BY " + ", ".join(f"{o['table']}.{o['column']} {o['direction']}" for o in model["orders"])
+    return query, params
+
+# Função para representar um parâmetro de lista como literal de array do Postgres
+def sql_array_literal(values):
+    return "{" + ",".join('"' + str(v).replace("\\", "\\\\").replace('"', '\\"') + '"' for v in values) + "}"
+
+# Função para embutir os parâmetros de uma query compilada como literais SQL, para exibição e para o RPC simples
+def render_query(query, params):
+    def literal(match):
+        value = params[int(match.group(1)) - 1]
+        return sql_literal(sql_array_literal(value) if isinstance(value, list) else value)
+    return re.sub(r"\$(\d+)", literal, query)
+
+# Configurações da proteção de queries (custo do planejador acima do qual o Testar Query pede confirmação)
+QUERY_COST_CONFIRM_THRESHOLD = float(st.secrets.get("QUERY_COST_CONFIRM_THRESHOLD", 1000000))
+QUERY_TIMEOUT_SECONDS = int(st.secrets.get("QUERY_TIMEOUT_SECONDS", 30))
+
+# As funções no servidor da proteção de queries (explain_sql, execute_sql_tagged, execute_sql_prepared, cancel_tagged_query)
+# vêm na migração supabase/migrations/20261016120000_query_guard_functions.sql; enquanto ela não for aplicada, as leituras
+# voltam para execute_sql_2 e o EXPLAIN é ignorado
+
+# Função para obter as linhas e o custo estimados pelo planejador para uma query, ou None quando o EXPLAIN não está disponível
+def explain_query(query):
+    query = query.strip().rstrip(";")
+
+    def load_plan():
+        try:
+            plan = supabase.rpc("explain_sql", {"query": query}).execute().data
+        except Exception:
+            return None
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        top = plan[0]["Plan"]
+        return {"rows": int(top["Plan Rows"]), "cost": float(top["Total Cost"])}
+    return get_result_cache().get(("plan", query_cache_key(query)[1]), load_plan)
+
+# Função para executar uma query de leitura com prazo, cancelando-a no servidor quando o prazo termina
+# (os executores também têm um statement_timeout de 300 s no servidor, que limita as chamadas sem prazo)
+def execute_sql_with_timeout(query, params=None, timeout_seconds=QUERY_TIMEOUT_SECONDS):
+    tag = f"query-guard-{uuid.uuid4().hex}"
+    if params:
+        rpc_name, rpc_params = "execute_sql_prepared", {
+            "query": query, "tag": tag,
+            "params": [sql_array_literal(value) if isinstance(value, list) else value for value in params]
+        }
+    else:
+        rpc_name, rpc_params = "execute_sql_tagged", {"query": query, "tag": tag}
+    pool = ThreadPoolExecutor(max_workers=1)
+    future = pool.submit(lambda: supabase.rpc(rpc_name, rpc_params).execute().data)
+    pool.shutdown(wait=False)
+    try:
+        return future.result(timeout=timeout_seconds)
+    except FutureTimeoutError:
+        supabase.rpc("cancel_tagged_query", {"tag": tag}).execute()
+        raise TimeoutError(f"Query cancelada após {timeout_seconds}s (tempo limite da instrução)")
+    except Exception as e:
+        if getattr(e, "code", None) == "PGRST202":  # O executor ainda não está visível na API (recarga do cache de schema pendente)
+            return execute_sql_2(render_query(query, params) if params else query)
+        raise
+
+# Transporte colunar: os resultados voltam como um array por coluna em vez de um dicionário por linha (desligado por padrão)
+COLUMNAR_RESULTS = str(st.secrets.get("COLUMNAR_RESULTS", "false")).lower() in ("1", "true", "yes")
+
+# Envoltório que transforma qualquer resultado num único objeto JSON {coluna: [valores]}, mantendo a ordem de colunas e linhas;
+# as colunas são agrupadas pela posição, então nomes repetidos (t1.id, t2.id) nunca se juntam num array com o dobro do tamanho
+COLUMNAR_RESULT_QUERY = """SELECT json_object_agg(column_name, column_values ORDER BY column_position) AS columns
+FROM (
+	SELECT MIN(cell.key) AS column_name,
+	       json_agg(cell.value ORDER BY source.row_index) AS column_values,
+	       cell.ordinality AS column_position
+	FROM (
+		SELECT row_to_json(columnar_source) AS row_json, row_number() OVER () AS row_index
+		FROM (
+{query}
+		) AS columnar_source
+	) AS source,
+	json_each(source.row_json) WITH ORDINALITY AS cell(key, value, ordinality)
+	GROUP BY cell.ordinality
+) AS columnar_columns"""
+# Códigos de erro do Postgres que indicam que a query não cabe na subquery do envoltório (p. ex. não é um único SELECT)
+COLUMNAR_UNSUPPORTED_CODES = {"42601"}
+
+# Função para executar uma query de leitura e devolver os dados prontos para pd.DataFrame: arrays por coluna quando
+# COLUMNAR_RESULTS está ligado, dicionários por linha caso contrário ou quando a query não cabe no envoltório ou devolve colunas de tamanhos diferentes;
+# timeouts e erros da própria query são propagados, não repetidos
+def fetch_query_data(query, params=None, timeout_seconds=QUERY_TIMEOUT_SECONDS):
+    if COLUMNAR_RESULTS:
+        try:
+            rows = execute_sql_with_timeout(
+                COLUMNAR_RESULT_QUERY.format(query=query.strip().rstrip(";")), params, timeout_seconds
+            )
+            columns = (rows[0].get("columns") if rows else None) or {}
+            if len({len(values) for values in columns.values()}) <= 1:
+                return columns
+        except Exception as e:
+            if getattr(e, "code", None) not in COLUMNAR_UNSUPPORTED_CODES:
+                raise
+    return execute_sql_with_timeout(query, params, timeout_seconds)
+
+# Função para envolver uma query de modo que o servidor devolva apenas uma página das suas linhas; devolve a query paginada e os seus parâmetros
+def paginate_query(query, page_size, page, params=None):
+    query = query.strip().rstrip(";")
+    limit, offset = int(page_size), int(page) * int(page_size)
+    if params:
+        # Vincula LIMIT/OFFSET também, para todas as páginas de uma query compilada partilharem um prepared statement
+        return (f"SELECT * FROM (\n{query}\n) AS paged_query\nLIMIT ${len(params) + 1} OFFSET ${len(params) + 2}",
+                list(params) + [limit, offset])
+    return f"SELECT * FROM (\n{query}\n) AS paged_query\nLIMIT {limit} OFFSET {offset}", params
+
+# Função para contar as linhas de uma query até um limite, devolvendo a contagem e se o limite foi atingido
+def estimate_query_rows(query, cap=COUNT_ESTIMATE_CAP, params=None):
+    query = query.strip().rstrip(";")
+    result = execute_sql_with_timeout(
+        f"SELECT COUNT(*) AS row_count FROM (SELECT 1 FROM (\n{query}\n) AS counted_query LIMIT {cap + 1}) AS capped_query",
+        params
+    )
+    row_count = int(result[0]["row_count"]) if result else 0
+    return min(row_count, cap), row_count > cap
+
+# Função para carregar uma página do resultado de uma query através do cache de resultados
+def get_query_page(query, page, page_size=PAGE_SIZE, params=None):
+    paged_query, paged_params = paginate_query(query, page_size, page, params)
+    page_key = ("page", query_cache_key(query, params)[1], int(page), int(page_size))
+    return get_result_cache().get(page_key, lambda: result_dataframe(query, fetch_query_data(paged_query, paged_params)))
+
+# Função para mostrar o resultado de uma query uma página de cada vez, carregando cada página a pedido
+def show_paginated_result(query, key, page_size=PAGE_SIZE, params=None):
+    count_key = ("count", query_cache_key(query, params)[1])
+    total_rows, capped = get_result_cache().get(count_key, lambda: estimate_query_rows(query, params=params))
+    pages = max(1, math.ceil(total_rows / page_size))
+    page = st.number_input(
+        f"Página (de {pages}{'+' if capped else ''}):",
+        min_value=1, max_value=None if capped else pages, value=1, key=key
+    ) - 1
+    df_page = get_query_page(query, page, page_size, params)
+    first_row = page * page_size + 1
+    st.caption(f"Linhas {first_row}-{first_row + len(df_page) - 1} de {'mais de ' if capped else ''}{total_rows}")
+    st.dataframe(df_page)
+    return df_page, total_rows
+
+# Função para envolver uma query em um GROUP BY de modo que só as linhas agregadas do gráfico saiam do banco
+def aggregate_query(query, group_column, value_column, aggregation="SUM"):
+    query = query.strip().rstrip(";")
+    group_sql = '"' + group_column.replace('"', '""') + '"'
+    value_sql = '"' + value_column.replace('"', '""') + '"'
+    measure = f"COUNT({value_sql})" if aggregation == "COUNT" else f"{aggregation}({value_sql}::numeric)"
+    return (
+        f"SELECT {group_sql}, {measure} AS {value_sql}\n"
+        f"FROM (\n{query}\n) AS chart_source\n"
+        f"GROUP BY {group_sql}\nORDER BY {group_sql}"
+    )
+
+# Função para carregar as linhas agregadas do gráfico de uma query através do cache de resultados
+def get_aggregated_result(query, group_column, value_column, aggregation="SUM", params=None):
+    chart_key = ("chart", query_cache_key(query, params)[1], group_column, value_column, aggregation)
+
+    def load_aggregate():
+        df = pd.DataFrame(fetch_query_data(aggregate_query(query, group_column, value_column, aggregation), params) or [])
+        if value_column in df.columns:
+            df[value_column] = pd.to_numeric(df[value_column], errors="coerce")
+        return df
+    return get_result_cache().get(chart_key, load_aggregate)
+
+# Função para reduzir uma série de linha mantendo o ponto mínimo e máximo de cada faixa ordenada pelo eixo X (linhas
+# espaçadas por igual quando o eixo Y não é numérico)
+def downsample_series(df, x_column, y_column, point_budget=LINE_CHART_POINT_BUDGET):
+    df = df.sort_values(x_column, kind="stable", ignore_index=True)
+    if len(df) <= point_budget:
+        return df
+    y = pd.to_numeric(df[y_column], errors="coerce").to_numpy(dtype=float)
+    valid = np.flatnonzero(~np.isnan(y))
+    if len(valid) < df[y_column].notna().sum():
+        # O eixo Y não é numérico, então não há mínimo/máximo a manter; usa linhas espaçadas por igual
+        return df.iloc[np.unique(np.linspace(0, len(df) - 1, point_budget).astype(int))]
+    if len(valid) <= point_budget:
+        return df.iloc[valid]
+    buckets = np.arange(len(valid)) * max(1, point_budget // 2) // len(valid)
+    # Sorting by (bucket, y) puts each bucket's min first and its max last
+    order = valid[np.lexsort((y[valid], buckets))]
+    starts = np.flatnonzero(np.diff(buckets, prepend=-1))
+    ends = np.append(starts[1:] - 1, len(valid) - 1)
+    keep = np.unique(np.concatenate([order[starts], order[ends], valid[[0, -1]]]))
+    return df.iloc[keep]
+
+# Função para permitir ao usuário alterar os valores de filtro ligados a uma query compilada do indicador
+def edit_query_params(compiled_query, params, key):
+    if not params:
+        return params
+    with st.expander("Valores dos filtros"):
+        st.code(compiled_query)
+        edited = []
+        for i, value in enumerate(params, start=1):
+            if isinstance(value, list):
+                text = st.text_input(f"${i} (separados por vírgula):", format_list_value(value), key=f"{key}_param_{i}")
+                edited.append(parse_list_value(text))
+            else:
+                edited.append(st.text_input(f"${i}:", str(value), key=f"{key}_param_{i}"))
+    return edited
+
+# Configurações da exportação (linhas buscadas por página ao gravar uma exportação em disco)
+EXPORT_PAGE_SIZE = int(st.secrets.get("EXPORT_PAGE_SIZE", 50000))
+EXPORT_ROW_COLUMN = "meta_export_row"
+EXPORT_TABLE_PREFIX = "meta_export_"
+EXPORT_DIR = os.path.join(tempfile.gettempdir(), "metadata_platform_exports")
+EXPORT_FILE_MAX_AGE = int(st.secrets.get("EXPORT_FILE_MAX_AGE", 3600))  # Segundos em que um arquivo exportado fica disponível para download
+EXPORT_FORMATS = {
+    "CSV": (".csv", "text/csv"),
+    "XLSX": (".xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+}
+if pq is not None:
+    EXPORT_FORMATS["Parquet"] = (".parquet", "application/vnd.apache.parquet")
+
+# Função para executar uma query uma única vez numa tabela de snapshot numerada por linha, para a exportação ler um resultado consistente e ordenado
+def create_export_snapshot(query, params=None):
+    # O horário de criação no nome permite a remove_stale_export_tables achar snapshots deixados por uma sessão morta
+    snapshot_table = f"{EXPORT_TABLE_PREFIX}{int(time.time())}_{uuid.uuid4().hex}"
+    query = (render_query(query, params) if params else query).strip().rstrip(";")
+    execute_sql(
+        f"CREATE TABLE {snapshot_table} AS\n"
+        f"SELECT row_number() OVER () AS {EXPORT_ROW_COLUMN}, export_source.*\nFROM (\n{query}\n) AS export_source;\n"
+        f"ALTER TABLE {snapshot_table} ADD PRIMARY KEY ({EXPORT_ROW_COLUMN});"
+    )
+    return snapshot_table
+
+# Função para percorrer o resultado de uma query página por página a partir do snapshot (keyset no número da linha), com uma página de cada vez
+def iter_query_pages(query, params=None, page_size=EXPORT_PAGE_SIZE):
+    snapshot_table = create_export_snapshot(query, params)
+    try:
+        # Tipos das colunas do snapshot, usados para tipar o schema Parquet
+        data_types = {
+            row["column_name"]: row["data_type"]
+            for row in execute_sql_2(SCHEMA_METADATA_QUERY.format(table_filter=f" AND c.table_name = {sql_literal(snapshot_table)}")) or []
+        }
+        last_row = 0
+        while True:
+            data = fetch_query_data(
+                f"SELECT * FROM {snapshot_table}\nWHERE {EXPORT_ROW_COLUMN} > {last_row}\n"
+                f"ORDER BY {EXPORT_ROW_COLUMN}\nLIMIT {int(page_size)}",
+                timeout_seconds=None
+            ) or []
+            if isinstance(data, list):
+                data = {col: [row.get(col) for row in data] for col in (data[0] if data else [])}
+            # Colunas object mantêm cada valor como veio (o pandas transformaria 1 em 1.0 ao lado de um 3.0)
+            df = pd.DataFrame({col: pd.Series(values, dtype=object) for col, values in data.items()})
+            if df.empty:
+                return
+            last_row = int(df[EXPORT_ROW_COLUMN].iloc[-1])
+            df = df.drop(columns=EXPORT_ROW_COLUMN)
+            df.attrs["data_types"] = data_types
+            yield df
+            if len(df) < page_size:
+                return
+    finally:
+        execute_sql(f"DROP TABLE IF EXISTS {snapshot_table};")
+
+# Função para deixar uma página crua gravável em todos os formatos de exportação (valores JSON como texto, o resto como veio)
+def export_frame(df):
+    for col in df.columns:
+        df[col] = pd.Series(
+            [json.dumps(value) if isinstance(value, (dict, list)) else value for value in df[col]], index=df.index, dtype=object
+        )
+    return df
+
+# Função para mapear o tipo de uma coluna Postgres para o tipo Parquet em que os seus valores exportados são gravados
+def parquet_type(data_type):
+    if data_type in ("smallint", "integer", "bigint"):
+        return pa.int64()
+    if data_type in ("real", "double precision", "numeric"):
+        return pa.float64()
+    if data_type == "boolean":
+        return pa.bool_()
+    return pa.string()
+
+# Função para apagar arquivos exportados mais antigos que a idade máxima, seja qual for a sessão que os preparou
+def remove_stale_exports(max_age=EXPORT_FILE_MAX_AGE):
+    if not os.path.isdir(EXPORT_DIR):
+        return
+    cutoff = time.time() - max_age
+    for entry in os.scandir(EXPORT_DIR):
+        try:
+            if entry.is_file() and entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+        except FileNotFoundError:  # Outra sessão apagou antes
+            pass
+
+# Função para apagar tabelas de snapshot de exportação mais antigas que a idade máxima, p. ex. deixadas por uma sessão que morreu no meio da exportação
+def remove_stale_export_tables(max_age=EXPORT_FILE_MAX_AGE):
+    rows = execute_sql_2(
+        f"SELECT tablename FROM pg_tables WHERE schemaname = 'public' AND starts_with(tablename, {sql_literal(EXPORT_TABLE_PREFIX)})"
+    ) or []
+    cutoff = time.time() - max_age
+    stale = []
+    for row in rows:
+        created = row["tablename"][len(EXPORT_TABLE_PREFIX):].split("_")[0]
+        # Snapshots nomeados antes do horário ser incluído não têm horário de criação e estão sempre vencidos
+        if not created.isdigit() or int(created) < cutoff:
+            stale.append(row["tablename"])
+    if stale:
+        execute_sql("".join(f"DROP TABLE IF EXISTS {table};" for table in stale))
+
+# Função para ler um arquivo exportado quando o download é clicado
+def read_export_file(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+# Função para gravar o resultado de uma query num arquivo temporário no formato escolhido, uma página de cada vez; devolve o caminho do arquivo
+def export_query(query, export_format, params=None, progress_callback=None, total_rows=None):
+    suffix = EXPORT_FORMATS[export_format][0]
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    with tempfile.NamedTemporaryFile(suffix=suffix, dir=EXPORT_DIR, delete=False) as export_file:
+        path = export_file.name
+    rows = 0
+    pages = (export_frame(df) for df in iter_query_pages(query, params))
+    if export_format == "CSV":
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            for df in pages:
+                df.to_csv(f, header=not rows, index=False)
+                rows += len(df)
+                if progress_callback:
+                    progress_callback(rows, total_rows)
+    elif export_format == "Parquet":
+        writer = None
+        try:
+            for df in pages:
+                if writer is None:
+                    schema = pa.schema([(col, parquet_type(df.attrs["data_types"].get(col))) for col in df.columns])
+                    writer = pq.ParquetWriter(path, schema, compression="zstd")
+                writer.write_table(pa.Table.from_pydict(
+                    {col: pa.array(df[col].tolist(), type=schema.field(col).type) for col in df.columns}, schema=schema
+                ))
+                rows += len(df)
+                if progress_callback:
+                    progress_callback(rows, total_rows)
+        finally:
+            if writer is not None:
+                writer.close()
+    else:
+        workbook = Workbook(write_only=True)
+        worksheet = workbook.create_sheet()
+        for df in pages:
+            if not rows:
+                worksheet.append(list(df.columns))
+            for row in df.where(df.notna(), None).itertuples(index=False, name=None):
+                worksheet.append(row)
+            rows += len(df)
+            if progress_callback:
+                progress_callback(rows, total_rows)
+        workbook.save(path)
+    return path
 
 # Interface do usuário
 def main():
@@ -140,6 +1461,17 @@ def main():
         criacao_indicadores_page()
     elif menu == "Dashboards":
         dashboards_page()
+    
+    # Contadores do cache de schema
+    schema_stats = get_schema_cache().stats()
+    st.sidebar.caption(f"Cache de schema: {schema_stats['hits']} hits, {schema_stats['misses']} misses, {schema_stats['entries']} entradas")
+    result_stats = get_result_cache().stats()
+    st.sidebar.caption(f"Cache de resultados: {result_stats['hits']} hits, {result_stats['misses']} misses, "
+                       f"{result_stats['entries']} entradas, {result_stats['bytes'] / 1024 / 1024:.1f} MB "
+                       f"({result_stats['raw_bytes'] / 1024 / 1024:.1f} MB antes da compactação)")
+    lineage_stats = get_lineage_writer().stats()
+    st.sidebar.caption(f"Fila de linhagem: {lineage_stats['pending']} pendentes, {lineage_stats['written']} gravados, "
+                       f"{lineage_stats['failed']} com falha")
 
 def entrada_dados_page():
     st.title("Entrada de Dados")
@@ -148,6 +1480,29 @@ def entrada_dados_page():
     tables = get_all_tables()
     raw_tables = [t for t in tables if t.startswith('raw_')]
     
+    # Configurações do upload
+    with st.expander("Configurações do upload"):
+        batch_size = st.number_input("Linhas por lote:", min_value=100, max_value=50000, value=INSERT_BATCH_SIZE, step=100)
+        max_workers = st.number_input("Uploads em paralelo:", min_value=1, max_value=16, value=INSERT_MAX_WORKERS)
+        streaming = st.checkbox("Modo streaming (ler arquivos grandes em blocos)")
+        chunk_size = st.number_input("Linhas por bloco:", min_value=1000, max_value=1000000, value=UPLOAD_CHUNK_SIZE,
+                                     step=1000, disabled=not streaming)
+    
+    # Repetir as linhas que sobraram de um upload com falhas parciais
+    failed_upload = st.session_state.get("failed_upload")
+    if failed_upload:
+        st.warning(f"{len(failed_upload['records'])} registros do último upload para {failed_upload['table']} não foram inseridos.")
+        if st.button("Repetir lotes com falha"):
+            with st.spinner("Inserindo dados..."):
+                summary = insert_records_to_table(
+                    failed_upload["table"], failed_upload["records"],
+                    batch_size=batch_size,
+                    max_workers=max_workers,
+                    progress_callback=streamlit_progress_callback("Linhas inseridas:")
+                )
+                if show_upload_summary(failed_upload["table"], summary):
+                    st.success(f"Dados inseridos com sucesso! {summary['rows_ok']} registros adicionados.")
+    
     # Opção para selecionar tabela existente ou criar nova
     option = st.radio("Selecione uma opção:", ["Inserir em tabela existente", "Criar nova tabela"])
     
@@ -163,18 +1518,24 @@ def entrada_dados_page():
         
         if uploaded_file is not None:
             try:
-                if uploaded_file.name.endswith('.csv'):
-                    df = pd.read_csv(uploaded_file)
-                else:
-                    df = pd.read_excel(uploaded_file)
+                # Apenas o primeiro bloco é mantido para o preview; o resto é lido durante a inserção
+                chunks = open_upload(uploaded_file, chunk_size if streaming else None)
+                df = next(chunks)
                 
                 st.write("Preview dos dados:")
                 st.dataframe(df.head())
                 
                 if st.button("Inserir Dados"):
                     with st.spinner("Inserindo dados..."):
-                        result = insert_data_to_table(selected_table, df)
-                        st.success(f"Dados inseridos com sucesso! {len(df)} registros adicionados.")
+                        result = insert_chunks_to_table(
+                            selected_table, itertools.chain([df], chunks),
+                            batch_size=batch_size,
+                            max_workers=max_workers,
+                            progress_callback=streamlit_progress_callback("Linhas inseridas:", uploaded_file),
+                            total_rows=None if streaming else len(df)
+                        )
+                        if show_upload_summary(selected_table, result):
+                            st.success(f"Dados inseridos com sucesso! {result['rows_ok']} registros adicionados.")
             except Exception as e:
                 st.error(f"Erro ao processar o arquivo: {str(e)}")
     
@@ -189,27 +1550,59 @@ def entrada_dados_page():
         
         if uploaded_file is not None and new_table_name.startswith('raw_'):
             try:
-                if uploaded_file.name.endswith('.csv'):
-                    df = pd.read_csv(uploaded_file)
-                else:
-                    df = pd.read_excel(uploaded_file)
+                # Apenas o primeiro bloco é mantido para o preview; o resto é lido durante a inserção
+                chunks = open_upload(uploaded_file, chunk_size if streaming else None)
+                df = next(chunks)
                 
                 st.write("Preview dos dados:")
                 st.dataframe(df.head())
                 
+                # Propor um tipo por coluna; o usuário pode alterar qualquer um antes de criar a tabela
+                normalize_columns(df)
+                # O modo streaming só vê o primeiro bloco, e um tipo que cabe nele pode não caber nas linhas seguintes, então as
+                # colunas ficam TEXT a menos que o usuário escolha um tipo
+                if streaming:
+                    proposed_types = {col: "TEXT" for col in df.columns}
+                    st.caption("Modo streaming: as colunas ficam TEXT por padrão porque só o primeiro bloco pode ser analisado.")
+                else:
+                    proposed_types = profile_column_types(df)
+                st.write("Tipos das colunas:")
+                edited_types = st.data_editor(
+                    pd.DataFrame({"coluna": list(proposed_types), "tipo": list(proposed_types.values())}),
+                    column_config={
+                        "coluna": st.column_config.TextColumn("Coluna", disabled=True),
+                        "tipo": st.column_config.SelectboxColumn("Tipo", options=COLUMN_TYPES, required=True)
+                    },
+                    hide_index=True, key="column_types_editor"
+                )
+                column_types = dict(zip(edited_types["coluna"], edited_types["tipo"]))
+                
+                # A carga em massa envia o arquivo inteiro num só pedido, o que o modo streaming existe para evitar
+                bulk_load = st.checkbox("Carga rápida em massa (criar a tabela e carregar todas as linhas numa só transação)", disabled=streaming)
+                
                 if st.button("Criar Tabela e Inserir Dados"):
                     with st.spinner("Criando tabela e inserindo dados..."):
                         # Verificar se a tabela já existe
                         if new_table_name in tables:
                             st.error(f"A tabela {new_table_name} já existe!")
+                        elif bulk_load and not streaming:
+                            # Criar tabela e carregar os dados numa única chamada ao servidor
+                            insert_result = create_raw_table_with_data(new_table_name, itertools.chain([df], chunks), column_types)
                         else:
                             # Criar tabela
-                            create_result = create_raw_table(new_table_name, df)
+                            create_result = create_raw_table(new_table_name, df, column_types)
                             
                             # Inserir dados
-                            insert_result = insert_data_to_table(new_table_name, df)
-                            
-                            st.success(f"Tabela {new_table_name} criada e {len(df)} registros inseridos com sucesso!")
+                            insert_result = insert_chunks_to_table(
+                                new_table_name, itertools.chain([df], chunks),
+                                batch_size=batch_size,
+                                max_workers=max_workers,
+                                progress_callback=streamlit_progress_callback("Linhas inseridas:", uploaded_file),
+                                total_rows=None if streaming else len(df)
+                            )
+                        
+                        if new_table_name not in tables and show_upload_summary(new_table_name, insert_result):
+                            st.success(f"Tabela {new_table_name} criada e {insert_result['rows_ok']} registros inseridos com sucesso!")
             except Exception as e:
                 st.error(f"Erro ao processar o arquivo: {str(e)}")
 
@@ -230,10 +1623,10 @@ def criacao_indicadores_page():
         source_tables = st.multiselect("Selecione as tabelas fonte:", tables)
         
         # Mostrar colunas das tabelas selecionadas
+        tables_metadata = get_tables_metadata(source_tables)
         all_columns = {}
         for table in source_tables:
-            columns = get_table_columns(table)
-            all_columns[table] = [col['column_name'] for col in columns]
+            all_columns[table] = [col['column_name'] for col in tables_metadata[table]]
             
         # Seleção de colunas para o indicador
         selected_columns = {}
@@ -336,90 +1729,110 @@ def criacao_indicadores_page():
     # Previsualização da query SQL
     st.subheader("Previsualização da Query SQL")
     
-    # Construir a query SQL
+    # Montar o modelo da query e compilá-lo em SQL parametrizado; os valores dos filtros são ligados, nunca concatenados
     query = ""
+    compiled_query, query_params = "", []
     if source_tables and all(table in all_columns for table in source_tables):
-        # Construir a cláusula SELECT
-        select_columns = []
-        for table in source_tables:
-            for col in selected_columns.get(table, []):
-                select_columns.append(f"{table}.{col}")
-        
-        if select_columns:
-            query = "SELECT " + ", ".join(select_columns) + "\n"
-            
-            # Construir a cláusula FROM
-            query += f"FROM {source_tables[0]}\n"
-            
-            # Adicionar JOINs
-            for join in joins:
-                query += f"{join['type']} {join['right_table']} ON {join['left_table']}.{join['left_column']} = {join['right_table']}.{join['right_column']}\n"
-            
-            # Adicionar filtros (WHERE)
-            if filters:
-                query += "WHERE "
-                filter_conditions = []
-                for f in filters:
-                    if f["operator"] in ["IN", "NOT IN"]:
-                        filter_conditions.append(f"{f['table']}.{f['column']} {f['operator']} ({f['value']})")
-                    elif f["operator"] == "LIKE":
-                        filter_conditions.append(f"{f['table']}.{f['column']} {f['operator']} '%{f['value']}%'")
-                    else:
-                        filter_conditions.append(f"{f['table']}.{f['column']} {f['operator']} '{f['value']}'")
-                query += " AND ".join(filter_conditions) + "\n"
-            
-            # Adicionar ordenação (ORDER BY)
-            if orders:
-                query += "ORDER BY "
-                order_conditions = []
-                for o in orders:
-                    order_conditions.append(f"{o['table']}.{o['column']} {o['direction']}")
-                query += ", ".join(order_conditions)
+        query_model = {
+            "tables": source_tables,
+            "columns": [[table, col] for table in source_tables for col in selected_columns.get(table, [])],
+            "joins": joins,
+            "filters": filters,
+            "orders": orders
+        }
+        if query_model["columns"]:
+            compiled_query, query_params = compile_query(query_model)
+            query = render_query(compiled_query, query_params)
     
     # Mostrar a query
     st.code(query)
     
-    # Botão para testar a query
-    if query and st.button("Testar Query"):
+    # Prévia do custo pelo planejador; queries caras precisam de confirmação antes de rodar
+    plan = explain_query(query) if query else None
+    confirmed = True
+    if plan:
+        st.caption(f"Linhas estimadas: {plan['rows']:,} · custo estimado: {plan['cost']:,.0f}")
+        if plan["cost"] > QUERY_COST_CONFIRM_THRESHOLD:
+            st.warning(f"O custo estimado está acima de {QUERY_COST_CONFIRM_THRESHOLD:,.0f}. Verifique os joins e filtros antes de rodar.")
+            confirmed = st.checkbox("Rodar mesmo assim")
+    
+    # Botão para testar a query (o resultado fica aberto durante a paginação até a query mudar)
+    if query and st.button("Testar Query", disabled=not confirmed):
+        st.session_state["tested_query"] = query
+    if query and confirmed and st.session_state.get("tested_query") == query:
         try:
             with st.spinner("Executando query..."):
-                result = execute_sql_2(query)
                 st.write("Resultado da Query:")
-                # Converter o resultado para DataFrame
-                if result:
-                    df_result = pd.DataFrame(result)
-                    st.dataframe(df_result)
-                else:
+                # Preview limitado; as páginas seguintes são carregadas a pedido
+                df_result, total_rows = show_paginated_result(compiled_query, "test_query_page", page_size=PREVIEW_ROW_LIMIT, params=query_params)
+                if not total_rows:
                     st.info("A query não retornou resultados.")
         except Exception as e:
             st.error(f"Erro ao executar a query: {str(e)}")
     
+    # Opção para persistir o resultado do indicador como tabela
+    materialize = st.checkbox("Materializar indicador como tabela (os dashboards leem o resultado armazenado)")
+    
+    # Assistente de índices: colunas de join e de filtro que seriam lidas com varredura sequencial
+    missing_indexes = advise_indexes(joins, filters, tables_metadata) if query else []
+    create_indexes = False
+    if missing_indexes:
+        st.caption("Colunas de join/filtro sem índice: " + ", ".join(f"{t}.{c}" for t, c in missing_indexes))
+        create_indexes = st.checkbox("Criar os índices ausentes ao salvar", value=True)
+    
     # Botão para salvar o indicador
     if query and indicator_name and st.button("Salvar Indicador"):
         try:
-            # Preparar dados para salvar
-            for table in source_tables:
-                for col in selected_columns.get(table, []):
-                    # Para cada coluna selecionada, criar um registro na tabela metadata_mappings
-                    save_metadata_mapping(
-                        source_table=table,
-                        source_column=col,
-                        target_table="indicador_" + indicator_name.lower().replace(" ", "_"),
-                        target_column=col,
-                        transformation_rule=query,
-                        data_type="TEXT",  # Simplificado, pode ser melhorado
-                        is_nullable=True
-                    )
+            target_table = "indicador_" + indicator_name.lower().replace(" ", "_")
             
-            # Registrar na tabela de linhagem
-            source_tables_str = ", ".join(source_tables)
-            log_data_lineage(
-                source_table=source_tables_str,
-                target_table="indicador_" + indicator_name.lower().replace(" ", "_"),
-                rows=0,  # Não temos o número exato aqui
-                layer="indicador",
-                transformation_query=query
-            )
+            # Criar os índices sugeridos antes de materializar para que a primeira carga já os use
+            if create_indexes:
+                created_indexes = create_advised_indexes(missing_indexes)
+                st.info(f"Índices criados: {', '.join(created_indexes)}")
+            
+            # Uma definição salva substitui qualquer resultado guardado: reconstruí-lo do zero (para conhecer o número
+            # de linhas), ou apagá-lo para os dashboards executarem a nova query
+            rows = 0
+            if materialize:
+                rows, _ = materialize_indicator(target_table, query, full_refresh=True)
+            else:
+                drop_indicator_table(target_table)
+            
+            # Um registro por coluna selecionada, levando o tipo declarado de cada coluna de origem
+            column_data_types = {
+                (table, col["column_name"]): col["data_type"].upper()
+                for table in source_tables for col in tables_metadata[table]
+            }
+            mappings = [
+                {
+                    "source_table": table,
+                    "source_column": col,
+                    "target_table": target_table,
+                    "target_column": col,
+                    "transformation_rule": query,
+                    "data_type": column_data_types.get((table, col), "TEXT"),
+                    "is_nullable": True,
+                    "compiled_query": compiled_query,
+                    "query_params": query_params
+                }
+                for table in source_tables for col in selected_columns.get(table, [])
+            ]
+            
+            # Gravar os mapeamentos e a linha de linhagem juntos para que uma falha nunca deixe um indicador pela metade
+            save_metadata_mappings(mappings, lineage={
+                "source_table": ", ".join(source_tables),
+                "target_table": target_table,
+                "rows": rows,  # Só é conhecido quando o indicador é materializado
+                "layer": "indicador",
+                "transformation_query": query
+            }, catalog={
+                "target_table": target_table,
+                "source_tables": ", ".join(source_tables),
+                "transformation_rule": query,
+                "compiled_query": compiled_query,
+                "query_params": query_params,
+                "column_count": len(mappings)
+            })
             
             st.success(f"Indicador '{indicator_name}' salvo com sucesso!")
         except Exception as e:
@@ -428,45 +1841,62 @@ def criacao_indicadores_page():
 def dashboards_page():
     st.title("Dashboards")
     
-    # Obter indicadores disponíveis
-    mappings = get_metadata_mappings()
+    # Obter indicadores disponíveis a partir do catálogo
+    indicator_names = get_indicator_names()
     
-    if not mappings:
+    if not indicator_names:
         st.warning("Não há indicadores disponíveis. Crie indicadores na página 'Criação de Indicadores'.")
         return
     
-    # Agrupar por target_table (indicadores)
-    indicators = {}
-    for mapping in mappings:
-        target = mapping.get('target_table', '')
-        if target.startswith('indicador_'):
-            if target not in indicators:
-                indicators[target] = []
-            indicators[target].append(mapping)
-    
     # Selecionar indicador para visualizar
-    indicator_names = list(indicators.keys())
     selected_indicator = st.selectbox("Selecione um indicador:", indicator_names)
     
     if selected_indicator:
         # Obter a query do indicador
-        indicator_data = indicators[selected_indicator]
-        query = indicator_data[0].get('transformation_rule', '')
+        indicator_data = get_indicator_definition(selected_indicator)
+        query = indicator_data.get('transformation_rule', '')
         
         st.subheader(f"Visualização do Indicador: {selected_indicator.replace('indicador_', '').replace('_', ' ').title()}")
         
-        # Executar a query para obter os dados do indicador
+        # Indicadores materializados são lidos da sua tabela em vez de recalcular os joins
+        materialized = selected_indicator in get_all_tables()
+        data_query = f"SELECT * FROM {selected_indicator}" if materialized else query
+        data_params = None
+        compiled_query = indicator_data.get('compiled_query')
+        if compiled_query and not materialized:
+            # Os valores dos filtros são ligados à query compilada, então novos valores reaproveitam o seu plano preparado
+            query_params = indicator_data.get('query_params') or []
+            if isinstance(query_params, str):
+                query_params = json.loads(query_params)
+            data_query, data_params = compiled_query, edit_query_params(compiled_query, query_params, selected_indicator)
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            # Descartar o resultado em cache para que a query seja executada novamente
+            if st.button("Atualizar dados"):
+                invalidate_query_results(data_query, data_params)
+        with col2:
+            full_refresh = materialized and st.checkbox("Atualização completa (ignorar a marca d'água incremental)")
+            if materialized and st.button("Atualizar tabela materializada"):
+                try:
+                    with st.spinner("Atualizando tabela materializada..."):
+                        rows, materialize_query = materialize_indicator(selected_indicator, query, full_refresh)
+                        source_tables_str = indicator_data.get('source_tables', '')
+                        log_data_lineage(source_tables_str, selected_indicator, rows, "indicador", materialize_query)
+                        st.success(f"Tabela materializada atualizada: {rows} linhas.")
+                except Exception as e:
+                    st.error(f"Erro ao atualizar a tabela materializada: {str(e)}")
+        
+        # Executar a query para obter os dados do indicador (as interações com os gráficos usam o cache de resultados)
         try:
             with st.spinner("Carregando dados do indicador..."):
-                result = execute_sql_2(query)
+                # Mostrar os dados em uma tabela, uma página de cada vez
+                st.subheader("Dados do Indicador")
+                df_page, total_rows = show_paginated_result(data_query, "indicator_page", params=data_params)
                 
-                if result:
-                    # Converter o resultado para DataFrame
-                    df_result = pd.DataFrame(result)
-                    
-                    # Mostrar os dados em uma tabela
-                    st.subheader("Dados do Indicador")
-                    st.dataframe(df_result)
+                if total_rows:
+                    # Os gráficos de barras e de pizza agregam no banco; os outros gráficos carregam o resultado completo através do cache de resultados
+                    columns = df_page.columns
                     
                     # Visualizações
                     st.subheader("Visualizações")
@@ -478,24 +1908,32 @@ def dashboards_page():
                     )
                     
                     if viz_type == "Tabela":
-                        st.dataframe(df_result)
+                        show_paginated_result(data_query, "table_viz_page", params=data_params)
                     
                     elif viz_type == "Gráfico de Barras":
                         # Configuração do gráfico de barras
-                        col1, col2 = st.columns(2)
+                        col1, col2, col3 = st.columns(3)
                         
                         with col1:
-                            x_axis = st.selectbox("Eixo X:", df_result.columns)
+                            x_axis = st.selectbox("Eixo X:", columns)
                         
                         with col2:
-                            y_axis = st.selectbox("Eixo Y:", df_result.columns, index=min(1, len(df_result.columns)-1))
+                            y_axis = st.selectbox("Eixo Y:", columns, index=min(1, len(columns)-1))
                         
-                        # Criar gráfico de barras
-                        fig = px.bar(df_result, x=x_axis, y=y_axis, title=f"{selected_indicator.replace('indicador_', '').replace('_', ' ').title()}")
-                        st.plotly_chart(fig, use_container_width=True)
+                        with col3:
+                            aggregation = st.selectbox("Agregação:", chart_aggregations(df_page[y_axis]))
+                        
+                        # Criar gráfico de barras com as linhas já agregadas no banco
+                        try:
+                            df_chart = get_aggregated_result(data_query, x_axis, y_axis, aggregation, data_params)
+                            fig = px.bar(df_chart, x=x_axis, y=y_axis, title=f"{selected_indicator.replace('indicador_', '').replace('_', ' ').title()}")
+                            st.plotly_chart(fig, use_container_width=True)
+                        except Exception as e:
+                            st.error(f"Erro ao montar o gráfico: {str(e)}")
                     
                     elif viz_type == "Gráfico de Linhas":
                         # Configuração do gráfico de linhas
+                        df_result = get_indicator_result(data_query, data_params)
                         col1, col2 = st.columns(2)
                         
                         with col1:
@@ -504,26 +1942,40 @@ def dashboards_page():
                         with col2:
                             y_axis = st.selectbox("Eixo Y (Valor):", df_result.columns, index=min(1, len(df_result.columns)-1))
                         
+                        # Reduzir a série antes de desenhar, salvo se for pedida a resolução completa
+                        full_resolution = st.checkbox("Resolução completa")
+                        df_chart = df_result if full_resolution else downsample_series(df_result, x_axis, y_axis)
+                        if len(df_chart) < len(df_result):
+                            st.caption(f"Mostrando {len(df_chart)} de {len(df_result)} pontos (mínimo/máximo por faixa)")
+                        
                         # Criar gráfico de linhas
-                        fig = px.line(df_result, x=x_axis, y=y_axis, title=f"{selected_indicator.replace('indicador_', '').replace('_', ' ').title()}")
+                        fig = px.line(df_chart, x=x_axis, y=y_axis, title=f"{selected_indicator.replace('indicador_', '').replace('_', ' ').title()}")
                         st.plotly_chart(fig, use_container_width=True)
                     
                     elif viz_type == "Gráfico de Pizza":
                         # Configuração do gráfico de pizza
-                        col1, col2 = st.columns(2)
+                        col1, col2, col3 = st.columns(3)
                         
                         with col1:
-                            names = st.selectbox("Nomes:", df_result.columns)
+                            names = st.selectbox("Nomes:", columns)
                         
                         with col2:
-                            values = st.selectbox("Valores:", df_result.columns, index=min(1, len(df_result.columns)-1))
+                            values = st.selectbox("Valores:", columns, index=min(1, len(columns)-1))
                         
-                        # Criar gráfico de pizza
-                        fig = px.pie(df_result, names=names, values=values, title=f"{selected_indicator.replace('indicador_', '').replace('_', ' ').title()}")
-                        st.plotly_chart(fig, use_container_width=True)
+                        with col3:
+                            aggregation = st.selectbox("Agregação:", chart_aggregations(df_page[values]))
+                        
+                        # Criar gráfico de pizza com as linhas já agregadas no banco
+                        try:
+                            df_chart = get_aggregated_result(data_query, names, values, aggregation, data_params)
+                            fig = px.pie(df_chart, names=names, values=values, title=f"{selected_indicator.replace('indicador_', '').replace('_', ' ').title()}")
+                            st.plotly_chart(fig, use_container_width=True)
+                        except Exception as e:
+                            st.error(f"Erro ao montar o gráfico: {str(e)}")
                     
                     elif viz_type == "Mapa de Calor":
                         # Verificar se há dados numéricos suficientes
+                        df_result = get_indicator_result(data_query, data_params)
                         numeric_cols = df_result.select_dtypes(include=['number']).columns.tolist()
                         
                         if len(numeric_cols) >= 2:
@@ -536,14 +1988,36 @@ def dashboards_page():
                         else:
                             st.warning("Não há colunas numéricas suficientes para criar um mapa de calor.")
                     
-                    # Opção para exportar dados
-                    csv = df_result.to_csv(index=False).encode('utf-8')
-                    st.download_button(
-                        "Exportar dados como CSV",
-                        data=csv,
-                        file_name=f"{selected_indicator.replace('indicador_', '')}.csv",
-                        mime="text/csv",
-                    )
+                    # Opção para exportar dados: gravados página por página num arquivo temporário, só quando pedido
+                    col1, col2 = st.columns(2)
+                    with col1:
+                        export_format = st.selectbox("Formato de exportação:", list(EXPORT_FORMATS))
+                    with col2:
+                        if st.button("Preparar exportação"):
+                            previous = st.session_state.pop("export_file", None)
+                            if previous and os.path.exists(previous["path"]):
+                                os.remove(previous["path"])
+                            path = export_query(
+                                data_query, export_format, data_params,
+                                progress_callback=streamlit_progress_callback("Linhas exportadas:"),
+                                total_rows=total_rows
+                            )
+                            suffix, mime = EXPORT_FORMATS[export_format]
+                            st.session_state["export_file"] = {
+                                "indicator": selected_indicator, "path": path, "mime": mime,
+                                "file_name": f"{selected_indicator.replace('indicador_', '')}{suffix}"
+                            }
+                    remove_stale_exports()
+                    remove_stale_export_tables()
+                    export_file = st.session_state.get("export_file")
+                    if export_file and export_file["indicator"] == selected_indicator and os.path.exists(export_file["path"]):
+                        # O arquivo só é lido quando o botão é clicado, não a cada rerun
+                        st.download_button(
+                            f"Baixar {export_file['file_name']}",
+                            data=lambda path=export_file["path"]: read_export_file(path),
+                            file_name=export_file["file_name"],
+                            mime=export_file["mime"],
+                        )
                 else:
                     st.info("O indicador não retornou resultados.")
         except Exception as e:
@@ -0,0 +1,71 @@
+-- Server-side helpers for the query guard in streamlite.py / streamlite_pt.py: EXPLAIN as JSON, query runners that
+-- tag their backend (the prepared one keeps a plan per statement text on each pooled connection, up to 100 per
+-- connection), and a cancel by tag.
+-- The runners carry a statement_timeout setting. PostgREST applies function settings to the transaction before it
+-- calls the function, so the server stops any read after 300 s even when the client sets no deadline (a SET inside
+-- the function body would not reach the statement already running). The client's shorter deadlines still cancel
+-- through cancel_tagged_query.
+CREATE OR REPLACE FUNCTION explain_sql(query text)
+RETURNS json LANGUAGE plpgsql AS $$
+DECLARE plan json;
+BEGIN
+	EXECUTE 'EXPLAIN (FORMAT JSON) ' || query INTO plan;
+	RETURN plan;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION execute_sql_tagged(query text, tag text)
+RETURNS json LANGUAGE plpgsql SET statement_timeout = '300s' AS $$
+DECLARE result json;
+BEGIN
+	PERFORM set_config('application_name', tag, true);
+	EXECUTE format('SELECT COALESCE(json_agg(t), ''[]''::json) FROM (%s) AS t', query) INTO result;
+	RETURN result;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION execute_sql_prepared(query text, params json, tag text)
+RETURNS json LANGUAGE plpgsql SET statement_timeout = '300s' AS $$
+DECLARE
+	statement_name text := 'prepared_' || md5(query);
+	stale_statement text;
+	arguments text;
+	result json;
+BEGIN
+	PERFORM set_config('application_name', tag, true);
+	IF NOT EXISTS (SELECT 1 FROM pg_prepared_statements WHERE name = statement_name) THEN
+		-- Keep at most 100 statements per pooled backend, dropping the least recently prepared ones
+		FOR stale_statement IN
+			SELECT name FROM pg_prepared_statements WHERE starts_with(name, 'prepared_')
+			ORDER BY prepare_time DESC OFFSET 99
+		LOOP
+			EXECUTE format('DEALLOCATE %I', stale_statement);
+		END LOOP;
+		EXECUTE format('PREPARE %I AS SELECT COALESCE(json_agg(t), ''[]''::json) FROM (%s) AS t', statement_name, query);
+	END IF;
+	SELECT string_agg(quote_nullable(value), ', ' ORDER BY position) INTO arguments
+	FROM json_array_elements_text(params) WITH ORDINALITY AS p(value, position);
+	EXECUTE format('EXECUTE %I(%s)', statement_name, arguments) INTO result;
+	RETURN result;
+END;
+$$;
+
+-- Runs as its owner so it can cancel backends of other roles; the search path is pinned so callers cannot shadow
+-- pg_stat_activity or pg_cancel_backend, and only the service role may call it
+CREATE OR REPLACE FUNCTION cancel_tagged_query(tag text)
+RETURNS boolean LANGUAGE sql SECURITY DEFINER SET search_path = pg_catalog, pg_temp AS $$
+	SELECT COALESCE(bool_or(pg_cancel_backend(pid)), false)
+	FROM pg_stat_activity
+	WHERE application_name = tag AND tag LIKE 'query-guard-%';
+$$;
+
+REVOKE ALL ON FUNCTION cancel_tagged_query(text) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION cancel_tagged_query(text) TO service_role;
+
+-- The runners execute arbitrary SQL, so they are closed to the API roles as well
+REVOKE ALL ON FUNCTION explain_sql(text), execute_sql_tagged(text, text), execute_sql_prepared(text, json, text)
+	FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION explain_sql(text), execute_sql_tagged(text, text), execute_sql_prepared(text, json, text)
+	TO service_role;
+
+NOTIFY pgrst, 'reload schema';
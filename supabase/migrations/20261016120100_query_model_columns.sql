@@ -0,0 +1,5 @@
+-- Columns that store an indicator's compiled query and its parameters next to transformation_rule in metadata_mappings
+ALTER TABLE metadata_mappings ADD COLUMN IF NOT EXISTS compiled_query TEXT;
+ALTER TABLE metadata_mappings ADD COLUMN IF NOT EXISTS query_params JSONB;
+
+NOTIFY pgrst, 'reload schema';
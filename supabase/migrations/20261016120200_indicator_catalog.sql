@@ -0,0 +1,26 @@
+-- One row per indicator with its SQL, so dashboards never scan metadata_mappings; backfilled from existing mappings of
+-- both apps (indicator_* from streamlite.py, indicador_* from streamlite_pt.py).
+-- System tables use the meta_ prefix, which indicator names can never produce
+CREATE TABLE IF NOT EXISTS meta_indicator_catalog (
+	target_table TEXT PRIMARY KEY,
+	source_tables TEXT,
+	transformation_rule TEXT,
+	compiled_query TEXT,
+	query_params JSONB,
+	column_count INTEGER,
+	updated_at TIMESTAMPTZ DEFAULT current_timestamp
+);
+
+INSERT INTO meta_indicator_catalog (target_table, source_tables, transformation_rule, compiled_query, query_params, column_count)
+SELECT target_table,
+       string_agg(DISTINCT source_table, ', '),
+       (array_agg(transformation_rule))[1],
+       (array_agg(compiled_query))[1],
+       (array_agg(query_params))[1],
+       COUNT(*)
+FROM metadata_mappings
+WHERE target_table LIKE 'indicator\_%' OR target_table LIKE 'indicador\_%'
+GROUP BY target_table
+ON CONFLICT (target_table) DO NOTHING;
+
+NOTIFY pgrst, 'reload schema';
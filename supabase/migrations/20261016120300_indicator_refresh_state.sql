@@ -0,0 +1,10 @@
+-- Table holding the high-water mark of every incrementally refreshed indicator
+CREATE TABLE IF NOT EXISTS meta_indicator_refresh_state (
+	target_table TEXT,
+	source_table TEXT,
+	high_water_mark TIMESTAMPTZ,
+	refreshed_at TIMESTAMPTZ DEFAULT current_timestamp,
+	PRIMARY KEY (target_table, source_table)
+);
+
+NOTIFY pgrst, 'reload schema';